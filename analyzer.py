@@ -0,0 +1,96 @@
+import re
+import sys
+import time
+from functools import lru_cache
+
+import pandas as pd
+from nltk.stem import PorterStemmer
+from nltk.corpus import stopwords
+# Uncomment to download stopwords if they are not available
+# nltk.download('stopwords')
+
+# Runs of ASCII letters and digits; everything else separates words
+TOKEN_PATTERN = re.compile(r"[a-zA-Z0-9]+")
+
+
+# Reusable text analyzer shared by indexing and querying
+class Analyzer:
+    """
+    Tokenizes, lowercases, removes stopwords and stems text exactly like cleaner_pipeline,
+    but loads the stopwords and the stemmer once and memoizes stems in a bounded LRU cache.
+    """
+
+    def __init__(self, stop_words=None, stem_cache_size=50000):
+        if stop_words is None:
+            stop_words = stopwords.words("english")
+        self.stop_words = frozenset(stop_words)
+        self.stemmer = PorterStemmer()
+        # Least recently used stems are evicted once the cache is full
+        self.stem = lru_cache(maxsize=stem_cache_size)(self.stemmer.stem)
+
+    def analyze(self, text):
+        """
+        Returns the list of stemmed, non-stopword tokens of a text.
+        """
+        stop_words = self.stop_words
+        stem = self.stem
+        return [stem(word) for word in map(str.lower, TOKEN_PATTERN.findall(text)) if word not in stop_words]
+
+    def analyze_many(self, texts):
+        """
+        Analyzes a batch of texts, returning one token list per text.
+        """
+        analyze = self.analyze
+        return [analyze(text) for text in texts]
+
+    def cache_info(self):
+        """
+        Hits, misses and size of the stem cache.
+        """
+        return self.stem.cache_info()
+
+
+_default_analyzer = None
+
+
+# Shared analyzer, created on first use so importing does not require the NLTK data
+def default_analyzer():
+    global _default_analyzer
+    if _default_analyzer is None:
+        _default_analyzer = Analyzer()
+    return _default_analyzer
+
+
+# Measure how fast an analyzer processes a corpus
+def measure_throughput(texts, analyzer=None):
+    """
+    Analyzes the texts once and reports the number of produced tokens and tokens per second.
+    """
+    if analyzer is None:
+        analyzer = default_analyzer()
+    start = time.perf_counter()
+    analyzed = analyzer.analyze_many(texts)
+    elapsed = time.perf_counter() - start
+    tokens = sum(len(words) for words in analyzed)
+    return {
+        "documents": len(analyzed),
+        "tokens": tokens,
+        "seconds": elapsed,
+        "tokens_per_second": tokens / elapsed if elapsed > 0 else float("inf"),
+    }
+
+
+def main():
+    restaurants_file = sys.argv[1] if len(sys.argv) > 1 else "restaurants_i.tsv"
+    descriptions = list(pd.read_csv(restaurants_file, sep="\t")["description"].fillna(""))
+
+    # The first pass fills the stem cache, the second one shows the warm throughput
+    for run in ("cold", "warm"):
+        stats = measure_throughput(descriptions)
+        print(f"{run}: {stats['tokens']} tokens in {stats['seconds']:.3f}s "
+              f"({stats['tokens_per_second']:.0f} tokens/s)")
+    print(default_analyzer().cache_info())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import ast
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# Score added for each preference a restaurant satisfies
+PREFERENCE_BOOST = 0.2
+
+# Options of the drop-down menus that mean "no preference"
+NO_PREFERENCE = {"i don't mind", "any taste will do!"}
+
+
+# Read a list-valued column whether it holds a list or its string form from the TSV
+def parse_list(value):
+    """
+    Returns the normalized items of a list attribute: a Python list, its repr string as written to
+    restaurants_i.tsv ("['Terrace', 'Car park']"), or a comma-separated string.
+    """
+    return [label for label in (normalize_label(item) for item in split_list(value)) if label]
+
+
+def split_list(value):
+    """
+    Same as parse_list, but keeps the items as they were written (only surrounding spaces and quotes removed).
+    """
+    if isinstance(value, (list, tuple, np.ndarray)):
+        items = value
+    elif not isinstance(value, str):
+        items = []
+    elif value.strip().startswith("["):
+        try:
+            items = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            items = value.strip().strip("[]").split(",")
+    else:
+        items = value.split(",")
+    return [item for item in (str(item).strip(" '\"") for item in items) if item]
+
+
+def normalize_label(label):
+    return str(label).strip(" '\"").lower()
+
+
+# Count the € symbols of a price range such as "€€€"
+def price_level(price_range):
+    if not isinstance(price_range, str):
+        return 0
+    return price_range.count("€")
+
+
+# Attributes of every restaurant, parsed once into NumPy and sparse structures
+class AttributeStore:
+    """
+    Columnar copy of the restaurant attributes used for boosting and filtering:
+    - price_levels: int8 number of € per restaurant (0 when unknown).
+    - cuisines, facilities, cards: one-hot sparse matrices (restaurant x label) with their label lists.
+    - regions: int32 code per restaurant (-1 when unknown) with the region names.
+    Rows follow the positional order of the DataFrame, i.e. the restaurant IDs used by the index.
+    """
+
+    def __init__(self, price_levels, cuisines, cuisine_names, facilities, facility_names,
+                 cards, card_names, regions, region_names):
+        self.price_levels = price_levels
+        self.cuisines = cuisines
+        self.cuisine_names = cuisine_names
+        self.facilities = facilities
+        self.facility_names = facility_names
+        self.cards = cards
+        self.card_names = card_names
+        self.regions = regions
+        self.region_names = region_names
+
+    @classmethod
+    def from_dataframe(cls, restaurants_df):
+        """
+        Parses the priceRange, cuisineType, facilitiesServices, creditCards and (if present) region columns.
+        """
+        def column(name):
+            if name in restaurants_df.columns:
+                return list(restaurants_df[name])
+            return [None] * len(restaurants_df)
+
+        price_levels = np.asarray([price_level(value) for value in column("priceRange")], dtype=np.int8)
+        cuisines, cuisine_names = one_hot([parse_list(value) for value in column("cuisineType")])
+        facilities, facility_names = one_hot([parse_list(value) for value in column("facilitiesServices")])
+        cards, card_names = one_hot([parse_list(value) for value in column("creditCards")])
+
+        region_names = sorted({value for value in column("region") if isinstance(value, str)})
+        region_codes = {name: code for code, name in enumerate(region_names)}
+        regions = np.asarray([region_codes.get(value, -1) for value in column("region")], dtype=np.int32)
+
+        return cls(price_levels, cuisines, cuisine_names, facilities, facility_names,
+                   cards, card_names, regions, region_names)
+
+    def __len__(self):
+        return len(self.price_levels)
+
+    def boost(self, doc_ids, scores, facility_choosen, cusine_choosen, min_money, max_money):
+        """
+        Adds PREFERENCE_BOOST to each score for a price within [min_money, max_money]
+        and for every chosen cuisine and facility the restaurant offers.
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        price = self.price_levels[doc_ids]
+        matches = ((price >= min_money) & (price <= max_money)).astype(np.float64)
+        matches += self.cuisines[doc_ids] @ selection(self.cuisine_names, cusine_choosen)
+        matches += self.facilities[doc_ids] @ selection(self.facility_names, facility_choosen)
+        return np.asarray(scores, dtype=np.float64) + PREFERENCE_BOOST * matches
+
+    def filter(self, doc_ids, region=None, credit_cards=None):
+        """
+        Boolean mask of the restaurants located in the region and accepting at least one of
+        the credit cards. A missing region or an empty card list does not filter.
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        keep = np.ones(len(doc_ids), dtype=bool)
+        if region:
+            code = self.region_names.index(region) if region in self.region_names else -2
+            keep &= self.regions[doc_ids] == code
+        card_selection = selection(self.card_names, credit_cards)
+        if card_selection.any():
+            keep &= (self.cards[doc_ids] @ card_selection) > 0
+        return keep
+
+
+# Build a one-hot matrix from the label lists of each restaurant
+def one_hot(labels_per_row):
+    """
+    Returns a (rows x labels) sparse matrix with a 1 where the row has the label, and the sorted labels.
+    """
+    names = sorted({label for labels in labels_per_row for label in labels})
+    codes = {name: code for code, name in enumerate(names)}
+    indptr, indices = [0], []
+    for labels in labels_per_row:
+        indices.extend(sorted({codes[label] for label in labels}))
+        indptr.append(len(indices))
+    matrix = csr_matrix((np.ones(len(indices), dtype=np.int8), np.asarray(indices, dtype=np.int32), indptr),
+                        shape=(len(labels_per_row), len(names)))
+    return matrix, names
+
+
+# Vector with a 1 for every chosen label
+def selection(names, chosen):
+    """
+    Turns the user's choice (a single label or a list of labels) into a vector over names.
+    """
+    if chosen is None:
+        chosen = []
+    elif isinstance(chosen, str):
+        chosen = [chosen]
+    chosen = {normalize_label(label) for label in chosen} - NO_PREFERENCE
+    vector = np.zeros(len(names))
+    for position, name in enumerate(names):
+        if name in chosen:
+            vector[position] = 1
+    return vector
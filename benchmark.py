@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from engine import non_ranked_engine, rank_query
+from functions import (description_cleaner,
+                       vocabulary_creator,
+                       reverse_index_creator,
+                       compute_TF,
+                       compute_IDF,
+                       compute_TF_IDF)
+from index import TFIDFIndex, save_index
+
+DEFAULT_SIZES = [2000, 20000, 200000, 1000000]
+
+# Words of the synthetic descriptions; the first ones are the most frequent (Zipf distribution)
+FOOD_WORDS = [
+    "cuisine", "dishes", "chef", "menu", "restaurant", "wine", "local", "traditional", "fish", "pasta",
+    "seasonal", "ingredients", "flavours", "modern", "kitchen", "tasting", "family", "dining", "room", "terrace",
+    "products", "meat", "vegetables", "fresh", "desserts", "creative", "sea", "view", "garden", "pizza",
+    "olive", "oil", "cheese", "truffle", "risotto", "homemade", "bread", "list", "selection", "atmosphere",
+    "elegant", "rustic", "contemporary", "regional", "classic", "recipes", "cellar", "lake", "mountain", "village",
+    "historic", "palazzo", "trattoria", "osteria", "tuscan", "sicilian", "neapolitan", "ligurian", "venetian",
+    "roman", "seafood", "shellfish", "lamb", "beef", "pork", "game", "mushrooms", "herbs", "lemon", "tomato",
+    "basil", "saffron", "octopus", "tuna", "anchovies", "prawns", "clams", "mussels", "squid", "gnocchi",
+    "ravioli", "tortellini", "lasagne", "polenta", "focaccia", "gelato", "tiramisu", "cannoli", "espresso",
+    "sommelier", "vineyard", "organic", "farm", "fireplace", "courtyard", "wood", "oven", "grill", "smoked",
+]
+
+CUISINES = ["Modern Cuisine", "Italian", "Seafood", "Creative", "Traditional Cuisine", "Regional Cuisine",
+            "Pizza", "Mediterranean Cuisine", "Country cooking", "Farm to table"]
+FACILITIES = ["Air conditioning", "Terrace", "Car park", "Garden or park", "Wheelchair access",
+              "Great view", "Interesting wine list", "Counter dining", "Valet parking", "Restaurant offering vegetarian menus"]
+CARDS = ["amex", "visa", "mastercard", "dinersclub", "maestro", "jcb"]
+REGIONS = ["Lombardy", "Tuscany", "Campania", "Piedmont", "Veneto", "Lazio", "Sicily", "Emilia-Romagna",
+           "Liguria", "Trentino-Alto Adige", "Apulia", "Sardinia", "Marche", "Umbria", "Friuli-Venezia Giulia"]
+
+
+# Synthetic restaurants with the columns written by parser.py and geocode_restaurants.py
+def synthetic_restaurants(n, seed=0, extra_words=20000):
+    """
+    Descriptions draw their words from FOOD_WORDS followed by `extra_words` rare generated words,
+    with Zipf-distributed frequencies, so postings lengths look like the ones of a real corpus.
+    Attributes follow skewed distributions (a few cuisines, regions and cards are far more common).
+    """
+    rng = np.random.default_rng(seed)
+    words = np.asarray(FOOD_WORDS + [f"w{i}" for i in range(extra_words)])
+    frequencies = 1.0 / np.arange(1, len(words) + 1) ** 1.1
+    frequencies /= frequencies.sum()
+
+    lengths = rng.integers(20, 80, n)
+    tokens = words[rng.choice(len(words), size=int(lengths.sum()), p=frequencies)]
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    descriptions = [" ".join(tokens[offsets[i]:offsets[i + 1]]) + "." for i in range(n)]
+
+    def labels(options, count, skew):
+        weights = 1.0 / np.arange(1, len(options) + 1) ** skew
+        picks = rng.choice(len(options), size=(n, count), p=weights / weights.sum())
+        return [[options[i] for i in dict.fromkeys(row)] for row in picks]
+
+    region_weights = 1.0 / np.arange(1, len(REGIONS) + 1)
+    regions = rng.choice(len(REGIONS), size=n, p=region_weights / region_weights.sum())
+    return pd.DataFrame({
+        "restaurantName": [f"Restaurant {i}" for i in range(n)],
+        "address": [f"Via Roma {i % 500 + 1}" for i in range(n)],
+        "city": [f"City {i}" for i in rng.integers(0, max(1, n // 20), n)],
+        "postalCode": [f"{code:05d}" for code in rng.integers(10, 98000, n)],
+        "country": "Italy",
+        "priceRange": ["€" * level for level in rng.choice([1, 2, 3, 4], size=n, p=[0.2, 0.4, 0.3, 0.1])],
+        "cuisineType": [", ".join(row) for row in labels(CUISINES, 2, 1.0)],
+        "description": descriptions,
+        "facilitiesServices": [str(row) for row in labels(FACILITIES, 3, 0.8)],
+        "creditCards": [str(row) for row in labels(CARDS, 3, 1.2)],
+        "phoneNumber": "+39 000 000000",
+        "website": [f"https://restaurant{i}.it" for i in range(n)],
+        "region": [REGIONS[i] for i in regions],
+        "latitude": rng.uniform(36.6, 47.1, n),
+        "longitude": rng.uniform(6.6, 18.5, n),
+    })
+
+
+# Queries of one to three words, mixing frequent and rare words of the vocabulary
+def synthetic_queries(vocabulary, count, seed=0):
+    rng = np.random.default_rng(seed + 1)
+    frequent = [word for word in FOOD_WORDS if word in vocabulary] or sorted(vocabulary)
+    rare = sorted(vocabulary)
+    queries = []
+    for _ in range(count):
+        size = int(rng.integers(1, 4))
+        words = [frequent[i] for i in rng.integers(0, len(frequent), size)]
+        if rng.random() < 0.3:
+            words[-1] = rare[int(rng.integers(0, len(rare)))]
+        queries.append(" ".join(words))
+    return queries
+
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "mean_ms": float(latencies.mean())}
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+# Benchmark one corpus size (runs in a fresh process, so its peak memory is its own)
+def run_size(n, queries_count=200, k=10, seed=0):
+    restaurants_df = synthetic_restaurants(n, seed)
+    build = {}
+    descriptions, build["description_cleaner_s"] = timed(description_cleaner, list(restaurants_df["description"]))
+    (ids_descriptions, vocabulary), build["vocabulary_creator_s"] = timed(vocabulary_creator, descriptions)
+    reverse_index, build["reverse_index_creator_s"] = timed(reverse_index_creator, ids_descriptions, True)
+    tf, build["compute_TF_s"] = timed(compute_TF, ids_descriptions)
+    idf, build["compute_IDF_s"] = timed(compute_IDF, reverse_index, n)
+    tf_idf, build["compute_TF_IDF_s"] = timed(compute_TF_IDF, tf, idf)
+    index, build["tfidf_index_s"] = timed(TFIDFIndex.from_reverse_index, tf_idf, idf, n, len(vocabulary))
+    build["total_s"] = sum(build.values())
+    del descriptions, ids_descriptions, tf, tf_idf
+
+    folder = tempfile.mkdtemp(prefix="benchmark_index_")
+    try:
+        save_index(index, vocabulary, folder)
+        index_bytes = folder_size(folder)
+    finally:
+        shutil.rmtree(folder)
+
+    queries = synthetic_queries(vocabulary, queries_count, seed)
+    latencies = {"non_ranked": [], "ranked": [], "ranked_top_k": []}
+    for query in queries:
+        # non_ranked_engine prints its table: keep the rendering in the timing, not on the terminal
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, elapsed = timed(non_ranked_engine, query, restaurants_df, vocabulary, reverse_index, k)
+        latencies["non_ranked"].append(elapsed)
+        latencies["ranked"].append(timed(rank_query, query, vocabulary, index)[1])
+        latencies["ranked_top_k"].append(timed(rank_query, query, vocabulary, index, k)[1])
+
+    return {
+        "documents": n,
+        "terms": len(vocabulary),
+        "postings": int(index.doc_matrix.nnz),
+        "build": build,
+        "queries": queries_count,
+        "k": k,
+        "latency": {name: percentiles(values) for name, values in latencies.items()},
+        "index_bytes": index_bytes,
+        "reverse_index_bytes": reverse_index.size_in_bytes(),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_memory_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Run every size and collect the results in one JSON-ready dict
+def run_benchmark(sizes=DEFAULT_SIZES, queries_count=200, k=10, seed=0):
+    results = []
+    for n in sizes:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_size, n, queries_count, k, seed).result()
+        results.append(result)
+        latency = result["latency"]
+        print(f"{n} documents: build {result['build']['total_s']:.1f}s, "
+              f"ranked p95 {latency['ranked']['p95_ms']:.2f}ms, "
+              f"non ranked p95 {latency['non_ranked']['p95_ms']:.2f}ms, "
+              f"peak memory {result['peak_memory_bytes'] / 2 ** 20:.0f}MB")
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search engine on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of restaurants")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.queries, args.k, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
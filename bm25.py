@@ -0,0 +1,133 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from functions import top_k
+
+# Term frequency saturation and document length normalization of BM25
+K1 = 1.2
+B = 0.75
+
+
+# BM25 IDF, always positive: log(1 + (N - df + 0.5) / (df + 0.5))
+def bm25_idf(document_frequency, total_documents):
+    document_frequency = np.asarray(document_frequency, dtype=np.float64)
+    return np.log1p((total_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+
+
+# Okapi BM25 over term-major postings of raw term counts
+class BM25Scorer:
+    """
+    Holds, for every term, the restaurants containing it with the term count (postings, a terms x
+    restaurants CSR matrix), plus the length of every description and the BM25 IDF of every term,
+    all computed when the index is built. A query is scored term at a time into one NumPy accumulator:
+
+        score(d) = sum over query terms t of idf(t) * tf(t, d) * (k1 + 1) / (tf(t, d) + k1 * (1 - b + b * |d| / avgdl))
+
+    BM25F: from_fields combines several fields (e.g. name and description) into weighted term counts
+    and lengths, which is BM25F with the same b for every field.
+    """
+
+    def __init__(self, postings, doc_lengths, idf=None, average_length=None, k1=K1, b=B):
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        if idf is None:
+            idf = bm25_idf(np.diff(postings.indptr), len(doc_lengths))
+        self.idf = idf
+        if average_length is None:
+            average_length = float(np.mean(doc_lengths)) if len(doc_lengths) else 0.0
+        self.average_length = average_length
+        self.k1 = k1
+        self.b = b
+        self._length_norms = None
+
+    @classmethod
+    def from_term_counts(cls, term_counts, doc_lengths=None, **parameters):
+        """
+        Builds the scorer from a restaurants x terms matrix of term counts. The description lengths
+        default to the number of counted terms of each row.
+        """
+        term_counts = csr_matrix(term_counts, dtype=np.float32)
+        if doc_lengths is None:
+            doc_lengths = np.asarray(term_counts.sum(axis=1)).ravel()
+        postings = term_counts.T.tocsr()
+        postings.sort_indices()
+        return cls(postings, np.asarray(doc_lengths, dtype=np.float32), **parameters)
+
+    @classmethod
+    def from_fields(cls, fields, **parameters):
+        """
+        fields: list of (term_counts, doc_lengths, weight), one per field, over the same terms.
+        """
+        term_counts = sum(weight * csr_matrix(counts, dtype=np.float32) for counts, _, weight in fields)
+        doc_lengths = sum(weight * np.asarray(lengths, dtype=np.float32) for _, lengths, weight in fields)
+        return cls.from_term_counts(term_counts, doc_lengths, **parameters)
+
+    @property
+    def total_documents(self):
+        return len(self.doc_lengths)
+
+    @property
+    def length_norms(self):
+        """
+        k1 * (1 - b + b * |d| / avgdl) for every restaurant.
+        """
+        if self._length_norms is None:
+            relative_lengths = self.doc_lengths / self.average_length if self.average_length else 0.0
+            self._length_norms = (self.k1 * (1 - self.b + self.b * relative_lengths)).astype(np.float32)
+        return self._length_norms
+
+    def score(self, term_ids):
+        """
+        BM25 score of every restaurant; a term repeated in the query counts once per occurrence.
+        """
+        scores = np.zeros(self.total_documents, dtype=np.float32)
+        terms, counts = np.unique([term for term in term_ids if 0 <= term < self.postings.shape[0]],
+                                  return_counts=True)
+        length_norms = self.length_norms
+        for term, count in zip(terms, counts):
+            start, end = self.postings.indptr[term], self.postings.indptr[term + 1]
+            docs = self.postings.indices[start:end]
+            tf = self.postings.data[start:end]
+            scores[docs] += (count * self.idf[term] * (self.k1 + 1)) * tf / (tf + length_norms[docs])
+        return scores
+
+    def score_candidates(self, term_ids, candidates):
+        """
+        BM25 score of each of the sorted, distinct candidate restaurant IDs. Only the postings entries
+        of the candidates are read: the shorter of a postings list and the candidates is looked up in
+        the other with a binary search.
+        """
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        terms, counts = np.unique([term for term in term_ids if 0 <= term < self.postings.shape[0]],
+                                  return_counts=True)
+        for term, count in zip(terms, counts):
+            start, end = self.postings.indptr[term], self.postings.indptr[term + 1]
+            docs = self.postings.indices[start:end]
+            if len(candidates) <= len(docs):
+                found = np.searchsorted(docs, candidates)
+                present = found < len(docs)
+                present[present] = docs[found[present]] == candidates[present]
+                rows, entries = np.flatnonzero(present), start + found[present]
+            else:
+                found = np.searchsorted(candidates, docs)
+                present = found < len(candidates)
+                present[present] = candidates[found[present]] == docs[present]
+                rows, entries = found[present], start + np.flatnonzero(present)
+            tf = self.postings.data[entries]
+            scores[rows] += (count * self.idf[term] * (self.k1 + 1)) * tf / (tf + self.length_norms[candidates[rows]])
+        return scores
+
+    def rank(self, term_ids, k=None, candidates=None):
+        """
+        Returns the ids and BM25 scores of the matching restaurants, best first (the k best when k is
+        given), optionally restricted to the candidate restaurant IDs, of which only the postings
+        entries are scored.
+        """
+        if candidates is None:
+            scores = self.score(term_ids)
+            doc_ids = np.flatnonzero(scores > 0)
+            return top_k(doc_ids, scores[doc_ids].astype(np.float64), k)
+        candidates = np.unique(np.asarray(candidates, dtype=np.int64))
+        scores = self.score_candidates(term_ids, candidates)
+        matching = scores > 0
+        return top_k(candidates[matching], scores[matching].astype(np.float64), k)
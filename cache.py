@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Build the cache key of a search
+def make_key(term_ids, filters=None, k=None, scorer="tfidf"):
+    """
+    Key made of the query's analyzed term IDs (their order does not change the scores),
+    the normalized filters, k and the scorer.
+    """
+    return tuple(sorted(term_ids)), freeze(filters), k, scorer
+
+
+def freeze(value):
+    """
+    Hashable form of filters made of dicts, lists and scalars. Dicts, lists and sets are
+    order-independent; tuples (e.g. coordinates) keep their order. Strings are kept as they are:
+    the region is matched exactly, so "Lombardia" and "lombardia" are different searches.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, tuple):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, (list, set, frozenset)):
+        return tuple(sorted(freeze(item) for item in value))
+    return value
+
+
+# LRU cache of search results with a time-to-live
+class ResultCache:
+    """
+    Keeps up to max_size results for ttl seconds, evicting the least recently used first.
+    Every lookup carries the generation of the index it would be answered from: when the
+    generation changes, the whole cache is dropped.
+    """
+
+    def __init__(self, max_size=1024, ttl=300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.generation = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, generation=0):
+        """
+        Returns the cached value, or None on a miss.
+        """
+        with self.lock:
+            self._check_generation(generation)
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < self.clock():
+                del self.entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation=0):
+        with self.lock:
+            self._check_generation(generation)
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Counters of the cache, with the hit ratio over all lookups.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _check_generation(self, generation):
+        if generation != self.generation:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.generation = generation
@@ -1,70 +1,219 @@
-import time
-from typing import List
-
-import requests
-from bs4 import BeautifulSoup
-
-CONST_URL = "https://guide.michelin.com/en/it/restaurants"
-
-
-# load all website's link to text file
-def get_html(url):
-    response = requests.get(url)
-    response.raise_for_status()
-    return response.content
-
-
-# get the maximum pages from site, which need to stop parser
-def get_number_of_max_pages() -> int:
-    html = get_html(CONST_URL)
-    soup = BeautifulSoup(html, "html.parser")
-    last_page_link = soup.select(
-        "div.js-restaurant__bottom-pagination ul.pagination a.btn.btn-outline-secondary.btn-sm")
-    max_pages = int(last_page_link[-2].get_text().strip())
-    return max_pages
-
-
-# parse every url from txt file
-def get_restaurant_urls(max_pages) -> List[str]:
-    restaurant_urls = []
-    page = 1
-    while page <= max_pages:
-        url = f"{CONST_URL}/page/{page}"
-        html = get_html(url)
-        soup = BeautifulSoup(html, "html.parser")
-
-        print(page, url)
-
-        restaurant_list = soup.select("div.row.restaurant__list-row.js-restaurant__list_items a.link")
-
-        if not restaurant_list:
-            break
-
-        for link in restaurant_list:
-            restaurant_url = link["href"]
-            if restaurant_url:
-                full_url = f"https://guide.michelin.com{restaurant_url}"
-                restaurant_urls.append(full_url)
-
-        page += 1
-        time.sleep(1)
-    print("Unique restaurant urls", len(set(restaurant_urls)))
-    return restaurant_urls
-
-
-# save to tsv file, parsed data
-def save_urls_to_file(restaurant_urls) -> None:
-    with open('restaurant_urls.txt', 'w') as f:
-        for url in restaurant_urls:
-            f.write(url + "\n")
-    print(f"Saved {len(restaurant_urls)} URL into restaurant_urls.txt")
-
-
-def main():
-    max_pages = get_number_of_max_pages()
-    restaurant_urls = get_restaurant_urls(max_pages)
-    save_urls_to_file(restaurant_urls)
-
-
-if __name__ == "__main__":
-    main()
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import List
+
+import aiohttp
+import requests
+from bs4 import BeautifulSoup
+
+CONST_URL = "https://guide.michelin.com/en/it/restaurants"
+SITE_URL = "https://guide.michelin.com"
+CHECKPOINT_FILE = "crawler_checkpoint.json"
+# Pages crawled between two saves of the checkpoint
+CHECKPOINT_INTERVAL = 20
+
+# HTTP statuses worth retrying: rate limited or temporary server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# load all website's link to text file
+def get_html(url):
+    response = requests.get(url)
+    response.raise_for_status()
+    return response.content
+
+
+# read the number of the last listing page from the pagination
+def parse_max_pages(html) -> int:
+    soup = BeautifulSoup(html, "html.parser")
+    last_page_link = soup.select(
+        "div.js-restaurant__bottom-pagination ul.pagination a.btn.btn-outline-secondary.btn-sm")
+    return int(last_page_link[-2].get_text().strip())
+
+
+# extract the restaurant links of one listing page
+def parse_restaurant_urls(html) -> List[str]:
+    soup = BeautifulSoup(html, "html.parser")
+    restaurant_list = soup.select("div.row.restaurant__list-row.js-restaurant__list_items a.link")
+    return [f"{SITE_URL}{link['href']}" for link in restaurant_list if link.get("href")]
+
+
+# get the maximum pages from site, which need to stop parser
+def get_number_of_max_pages() -> int:
+    return parse_max_pages(get_html(CONST_URL))
+
+
+# parse every url from txt file
+def get_restaurant_urls(max_pages) -> List[str]:
+    restaurant_urls = []
+    page = 1
+    while page <= max_pages:
+        url = f"{CONST_URL}/page/{page}"
+        html = get_html(url)
+
+        print(page, url)
+
+        page_urls = parse_restaurant_urls(html)
+        if not page_urls:
+            break
+        restaurant_urls.extend(page_urls)
+
+        page += 1
+        time.sleep(1)
+    print("Unique restaurant urls", len(set(restaurant_urls)))
+    return restaurant_urls
+
+
+# limit the request rate shared by all the concurrent downloads
+class TokenBucket:
+    """
+    Allows `rate` requests per second on average, with bursts of up to `capacity` requests.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# download a page with the shared session, retrying with exponential backoff
+async def fetch_html(session, url, rate_limiter, retries=3, backoff=1.0):
+    for attempt in range(retries + 1):
+        await rate_limiter.acquire()
+        try:
+            async with session.get(url) as response:
+                if response.status not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return await response.read()
+                error = aiohttp.ClientResponseError(response.request_info, response.history,
+                                                    status=response.status, message=response.reason)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as connection_error:
+            error = connection_error
+        if attempt == retries:
+            raise error
+        # jitter keeps the retries of concurrent pages from hitting the site at the same time
+        await asyncio.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+# pages already crawled by a previous, interrupted run of the same crawl (same base_url and max_pages)
+def load_checkpoint(checkpoint_file, base_url, max_pages):
+    if not checkpoint_file or not os.path.exists(checkpoint_file):
+        return {}
+    with open(checkpoint_file) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("base_url") != base_url or checkpoint.get("max_pages") != max_pages:
+        print(f"Ignoring {checkpoint_file}: it was written by a crawl of another site or page count")
+        return {}
+    return {int(page): urls for page, urls in checkpoint["pages"].items()}
+
+
+def save_checkpoint(checkpoint_file, base_url, max_pages, pages):
+    # write to a temporary file first, so an interruption never leaves a truncated checkpoint
+    temporary_file = checkpoint_file + ".tmp"
+    with open(temporary_file, "w") as f:
+        json.dump({"base_url": base_url, "max_pages": max_pages,
+                   "pages": {str(page): urls for page, urls in pages.items()}}, f)
+    os.replace(temporary_file, checkpoint_file)
+
+
+# crawl the listing pages concurrently
+async def crawl_restaurant_urls(max_pages=None, base_url=CONST_URL, concurrency=8, rate=4.0, retries=3,
+                                backoff=1.0, checkpoint_file=CHECKPOINT_FILE, timeout=30, resume=False,
+                                checkpoint_interval=CHECKPOINT_INTERVAL) -> List[str]:
+    """
+    Downloads the listing pages with one pooled HTTP session, at most `concurrency` at a time and
+    `rate` requests per second. The finished pages are saved to the checkpoint file every
+    `checkpoint_interval` pages and when the crawl stops early; the file is deleted once every page is
+    crawled. With resume=True, a run interrupted before that only fetches the pages that are still
+    missing. A page that still fails after its retries cancels the other pages and is raised.
+    Returns the restaurant URLs in page order.
+    """
+    rate_limiter = TokenBucket(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        if max_pages is None:
+            max_pages = parse_max_pages(await fetch_html(session, base_url, rate_limiter, retries, backoff))
+        pages = load_checkpoint(checkpoint_file, base_url, max_pages) if resume else {}
+
+        async def crawl_page(page):
+            url = f"{base_url}/page/{page}"
+            async with semaphore:
+                html = await fetch_html(session, url, rate_limiter, retries, backoff)
+            pages[page] = parse_restaurant_urls(html)
+            print(page, url, len(pages[page]))
+            if checkpoint_file and len(pages) % checkpoint_interval == 0:
+                save_checkpoint(checkpoint_file, base_url, max_pages, pages)
+
+        missing = [page for page in range(1, max_pages + 1) if page not in pages]
+        tasks = [asyncio.create_task(crawl_page(page)) for page in missing]
+        completed = False
+        try:
+            await asyncio.gather(*tasks)
+            completed = True
+        finally:
+            # A failed or interrupted crawl stops the other pages before the session is closed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if checkpoint_file and not completed and pages:
+                save_checkpoint(checkpoint_file, base_url, max_pages, pages)
+
+    # The crawl is complete: a later run must not reuse these pages
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    restaurant_urls = [url for page in sorted(pages) if page <= max_pages for url in pages[page]]
+    print("Unique restaurant urls", len(set(restaurant_urls)))
+    return restaurant_urls
+
+
+# save to tsv file, parsed data
+def save_urls_to_file(restaurant_urls) -> None:
+    with open('restaurant_urls.txt', 'w') as f:
+        for url in restaurant_urls:
+            f.write(url + "\n")
+    print(f"Saved {len(restaurant_urls)} URL into restaurant_urls.txt")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect the restaurant URLs of the Michelin Guide")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="crawl the pages concurrently")
+    parser.add_argument("--base-url", default=CONST_URL)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=4.0, help="requests per second")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted crawl from its checkpoint")
+    args = parser.parse_args()
+
+    if args.use_async:
+        restaurant_urls = asyncio.run(crawl_restaurant_urls(
+            base_url=args.base_url, concurrency=args.concurrency, rate=args.rate,
+            retries=args.retries, checkpoint_file=args.checkpoint, resume=args.resume))
+    else:
+        max_pages = get_number_of_max_pages()
+        restaurant_urls = get_restaurant_urls(max_pages)
+    save_urls_to_file(restaurant_urls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from attributes import AttributeStore, normalize_label, split_list
+
+DATASET_FORMAT_VERSION = 2
+DATASET_FORMAT_NAME = "michelin-restaurants"
+
+# Columns holding a few distinct values, stored as integer codes plus the list of values
+CATEGORY_COLUMNS = {"priceRange", "city", "country", "region"}
+
+# Columns holding a list of labels per restaurant
+LIST_COLUMNS = {"cuisineType", "facilitiesServices", "creditCards"}
+
+
+# Typed columnar copy of the restaurants, backed by memory-mapped .npy files
+class RestaurantDataset:
+    """
+    Every column is stored in one of four layouts:
+    - number: one array with a value per restaurant.
+    - string: UTF-8 bytes of all the values (data) with the offset of each value (offsets) and a missing mask.
+    - category: int32 code per restaurant (-1 when missing) into the sorted categories.
+    - list: int32 codes of all the labels (values) with the offset of each restaurant's labels (offsets),
+      i.e. the CSR form of a restaurant x label one-hot matrix, plus the original text of every value
+      (text_data, text_offsets, text_missing) laid out like a string column.
+    Rows follow the order of the DataFrame the dataset was saved from, i.e. the restaurant IDs of the index.
+    dataset[name] and row() return the values as read from the TSV (a list column gives its text), and only
+    decode what is asked for.
+    """
+
+    def __init__(self, columns, arrays, categories, total_rows, generation=0):
+        self.columns = columns
+        self.arrays = arrays
+        self.categories = categories
+        self.total_rows = total_rows
+        self.generation = generation
+
+    def __len__(self):
+        return self.total_rows
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def kind(self, name):
+        return self.columns[name]
+
+    def value(self, name, row):
+        """
+        Value of one cell, typed like the TSV column: a number (NaN when missing), or a string
+        (None when missing), the text of the list for a list column.
+        """
+        kind = self.columns[name]
+        arrays = self.arrays[name]
+        if kind == "number":
+            return arrays["values"][row].item()
+        if kind == "category":
+            code = arrays["codes"][row]
+            return None if code < 0 else self.categories[name][code]
+        prefix = "" if kind == "string" else "text_"
+        if arrays[prefix + "missing"][row]:
+            return None
+        offsets = arrays[prefix + "offsets"]
+        return arrays[prefix + "data"][offsets[row]:offsets[row + 1]].tobytes().decode("utf-8")
+
+    def row(self, row, columns=None):
+        """
+        {column: value} of one restaurant for the selected columns (all by default), decoding only them.
+        """
+        columns = list(self.columns) if columns is None else columns
+        return {name: self.value(name, row) if name in self.columns else None for name in columns}
+
+    def column(self, name):
+        """
+        Values of a whole column, typed like the TSV column: the memory-mapped array for numbers,
+        otherwise a list of strings (None when missing).
+        """
+        if self.columns[name] == "number":
+            return self.arrays[name]["values"]
+        return [self.value(name, row) for row in range(self.total_rows)]
+
+    def labels(self, name):
+        """
+        Label lists of a list column, one per restaurant.
+        """
+        if self.total_rows == 0:
+            return []
+        arrays = self.arrays[name]
+        labels = np.asarray(self.categories[name], dtype=object)
+        return [list(part) for part in np.split(labels[arrays["values"]], arrays["offsets"][1:-1])]
+
+    def codes(self, name):
+        """
+        Integer codes of a category column, without decoding them.
+        """
+        return self.arrays[name]["codes"]
+
+    def one_hot(self, name):
+        """
+        (restaurants x labels) sparse matrix of a list column, sharing the stored arrays.
+        """
+        arrays = self.arrays[name]
+        data = np.ones(len(arrays["values"]), dtype=np.int8)
+        return csr_matrix((data, arrays["values"], arrays["offsets"]),
+                          shape=(self.total_rows, len(self.categories[name])))
+
+    def to_dataframe(self, columns=None):
+        """
+        DataFrame with the selected columns (all by default), with the same values as the TSV.
+        """
+        columns = list(self.columns) if columns is None else columns
+        return pd.DataFrame({name: self.column(name) for name in columns}, columns=columns)
+
+    def attributes(self):
+        """
+        AttributeStore built from the stored codes, without parsing any string.
+        """
+        def labels(name):
+            if name not in self.columns:
+                return csr_matrix((self.total_rows, 0), dtype=np.int8), []
+            names, matrix = normalize_categories(self.categories[name], self.one_hot(name))
+            return matrix, names
+
+        if "priceRange" in self.columns:
+            levels = np.asarray([category.count("€") for category in self.categories["priceRange"]] + [0],
+                                dtype=np.int8)
+            price_levels = levels[self.codes("priceRange")]
+        else:
+            price_levels = np.zeros(self.total_rows, dtype=np.int8)
+        cuisines, cuisine_names = labels("cuisineType")
+        facilities, facility_names = labels("facilitiesServices")
+        cards, card_names = labels("creditCards")
+
+        if "region" in self.columns:
+            region_names = list(self.categories["region"])
+            regions = np.asarray(self.codes("region"), dtype=np.int32)
+        else:
+            region_names = []
+            regions = np.full(self.total_rows, -1, dtype=np.int32)
+        return AttributeStore(price_levels, cuisines, cuisine_names, facilities, facility_names,
+                              cards, card_names, regions, region_names)
+
+
+# Merge the labels that only differ by case, as AttributeStore compares normalized labels
+def normalize_categories(categories, matrix):
+    names, codes = np.unique([normalize_label(category) for category in categories], return_inverse=True)
+    names = names.tolist()
+    if np.array_equal(codes, np.arange(len(categories))):
+        return names, matrix
+    matrix = csr_matrix((matrix.data, codes[matrix.indices], matrix.indptr), shape=(matrix.shape[0], len(names)))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return names, matrix
+
+
+# Choose the layout of a DataFrame column
+def column_kind(name, series):
+    if name in LIST_COLUMNS:
+        return "list"
+    if name in CATEGORY_COLUMNS:
+        return "category"
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return "number"
+    return "string"
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def encode_column(kind, values):
+    """
+    Returns the arrays of one column and its categories (None for numbers and strings).
+    """
+    if kind == "number":
+        return {"values": np.asarray(values)}, None
+
+    if kind == "string":
+        missing = np.asarray([is_missing(value) for value in values], dtype=bool)
+        encoded = [b"" if gap else str(value).encode("utf-8") for value, gap in zip(values, missing)]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return {"data": data, "offsets": offsets, "missing": missing}, None
+
+    if kind == "category":
+        labels = [None if is_missing(value) else str(value).strip() for value in values]
+        categories = sorted({label for label in labels if label})
+        lookup = {category: code for code, category in enumerate(categories)}
+        codes = np.asarray([lookup.get(label, -1) for label in labels], dtype=np.int32)
+        return {"codes": codes}, categories
+
+    labels_per_row = [list(dict.fromkeys(split_list(value))) for value in values]
+    categories = sorted({label for labels in labels_per_row for label in labels})
+    lookup = {category: code for code, category in enumerate(categories)}
+    offsets = np.zeros(len(labels_per_row) + 1, dtype=np.int64)
+    np.cumsum([len(labels) for labels in labels_per_row], out=offsets[1:])
+    codes = np.asarray([lookup[label] for labels in labels_per_row for label in labels], dtype=np.int32)
+    text, _ = encode_column("string", values)
+    arrays = {"values": codes, "offsets": offsets}
+    arrays.update({"text_" + array_name: array for array_name, array in text.items()})
+    return arrays, categories
+
+
+# Save the restaurants in the columnar layout
+def save_dataset(restaurants_df, path):
+    """
+    Writes one .npy file per array (<column>.<array>.npy) and meta.json, which holds the format,
+    the kind of every column, the categories and a generation stamp (written last).
+    """
+    os.makedirs(path, exist_ok=True)
+    restaurants_df = restaurants_df.reset_index(drop=True)
+    columns = {}
+    categories = {}
+    for name in restaurants_df.columns:
+        kind = column_kind(name, restaurants_df[name])
+        arrays, column_categories = encode_column(kind, list(restaurants_df[name]))
+        for array_name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.{array_name}.npy"), array)
+        columns[name] = kind
+        if column_categories is not None:
+            categories[name] = column_categories
+
+    meta = {
+        "format": DATASET_FORMAT_NAME,
+        "version": DATASET_FORMAT_VERSION,
+        "total_rows": len(restaurants_df),
+        "columns": columns,
+        "categories": categories,
+        "generation": time.time_ns(),
+    }
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+# Open a dataset written by save_dataset
+def load_dataset(path, mmap_mode="r"):
+    """
+    Memory-maps every array, so opening the dataset does not read or convert any column.
+    """
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != DATASET_FORMAT_NAME or meta.get("version") != DATASET_FORMAT_VERSION:
+        raise ValueError(f"Unsupported dataset format in {path}: {meta.get('format')} v{meta.get('version')}")
+
+    layouts = {"number": ["values"], "string": ["data", "offsets", "missing"],
+               "category": ["codes"],
+               "list": ["values", "offsets", "text_data", "text_offsets", "text_missing"]}
+    arrays = {}
+    for name, kind in meta["columns"].items():
+        arrays[name] = {array_name: np.load(os.path.join(path, f"{name}.{array_name}.npy"), mmap_mode=mmap_mode)
+                        for array_name in layouts[kind]}
+    return RestaurantDataset(meta["columns"], arrays, meta["categories"], meta["total_rows"], meta["generation"])
+
+
+# Read the restaurants from a TSV file or a dataset folder
+def read_restaurants(path):
+    """
+    Returns the restaurants and, for a dataset folder, its AttributeStore (None for a TSV).
+    The restaurants are a DataFrame for a TSV and the memory-mapped RestaurantDataset for a folder:
+    both give the TSV values through restaurants[column], and a dataset only decodes the columns read.
+    """
+    if os.path.isdir(path):
+        dataset = load_dataset(path)
+        return dataset, dataset.attributes()
+    return pd.read_csv(path, sep="\t"), None
+
+
+# Convert restaurants_i.tsv into a dataset folder
+def convert_tsv(tsv_file, path):
+    restaurants_df = pd.read_csv(tsv_file, sep="\t", dtype={"postalCode": str, "phoneNumber": str})
+    save_dataset(restaurants_df, path)
+    return len(restaurants_df)
+
+
+def main():
+    tsv_file = sys.argv[1] if len(sys.argv) > 1 else "restaurants_i.tsv"
+    path = sys.argv[2] if len(sys.argv) > 2 else "restaurants"
+    rows = convert_tsv(tsv_file, path)
+    print(f"Saved {rows} restaurants from {tsv_file} into {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,41 @@
 # Import specific functions from a custom module and libraries for computations and formatting
-from functions import (cleaner_pipeline,
-                       restaurants_matcher,
+from functions import (restaurants_matcher,
                        top_k_printer,
-                       normalize_vectors,
-                       upgrade_TF_IDF_score,
+                       top_k,
                        drop_down_menu,
-                       advanced_drop_down_menu,
-                       advanced_upgrade_TF_IDF_score)  # Custom utility functions
-import numpy as np  # Numerical operations
-from sklearn.metrics.pairwise import cosine_similarity  # Pairwise cosine similarity computation
+                       advanced_drop_down_menu)  # Custom utility functions
+from attributes import AttributeStore  # Parsed restaurant attributes for boosting and filtering
+from analyzer import default_analyzer  # Shared, memoized text analyzer
+from cache import make_key  # Keys of the optional result cache
+from index import TFIDFIndex  # Sparse TF-IDF scoring
+from metrics import metrics  # Optional per-stage timings
+from planner import QueryPlanner  # Filter pushdown for the advanced engine
+from positional import parse_phrases  # Phrase and proximity syntax of the queries
 from tabulate import tabulate  # For displaying data in table format
-import pandas as pd  # DataFrame handling
 import asyncio
 
+# Index built by shared_index: (reverse_index_tf_idf, IDF_by_words, total documents, TFIDFIndex)
+_shared_index = None
+
+
+# Build the TF-IDF index of a reverse index once and reuse it while the same dicts are passed in
+def shared_index(reverse_index_tf_idf, IDF_by_words, total_documents):
+    """
+    The engines called without a prebuilt index score with this one: it is rebuilt only when other
+    reverse_index_tf_idf / IDF_by_words objects (compared by identity) or a different number of
+    restaurants are passed, so its generation, and the results cached under it, survive across calls.
+    The dicts must not be modified in place afterwards.
+    """
+    global _shared_index
+    if (_shared_index is None or _shared_index[0] is not reverse_index_tf_idf
+            or _shared_index[1] is not IDF_by_words or _shared_index[2] != total_documents):
+        index = TFIDFIndex.from_reverse_index(reverse_index_tf_idf, IDF_by_words, total_documents)
+        _shared_index = (reverse_index_tf_idf, IDF_by_words, total_documents, index)
+    return _shared_index[3]
+
 
 # Define a function to search and display restaurant matches without ranking them
-def non_ranked_engine(querry, restaurants_df, vocabulary, reverse_index, top_k_to_print):
+def non_ranked_engine(querry, restaurants_df, vocabulary, reverse_index, top_k_to_print, positional=None):
     """
     Matches restaurants based on query words but without ranking.
 
@@ -23,34 +43,130 @@ def non_ranked_engine(querry, restaurants_df, vocabulary, reverse_index, top_k_t
     - querry: User's search query as a string.
     - restaurants_df: DataFrame containing restaurant information.
     - vocabulary: Dictionary mapping words to IDs.
-    - reverse_index: Dictionary mapping word IDs to restaurant IDs.
+    - reverse_index: Mapping of word IDs to restaurant IDs (a dict or a CompressedReverseIndex).
+    - positional: Optional PositionalIndex; with it, "quoted words" must appear as an exact phrase
+      and "quoted words"~N within a window of N words.
 
     Returns:
     - Processed results using the top_k_printer function.
     """
     # Clean and preprocess the query
-    processed_querry = cleaner_pipeline(querry)
-
-    # Map each processed word to its corresponding ID in the vocabulary if it exists
-    processed_querry = [vocabulary[key] for key in processed_querry if key in vocabulary.keys()]
+    with metrics.stage("analyze"):
+        phrases = []
+        if positional is not None:
+            querry, phrases = parse_phrases(querry)
+        processed_querry = default_analyzer().analyze(querry)
+
+        # Map each processed word to its corresponding ID in the vocabulary if it exists
+        processed_querry = [vocabulary[key] for key in processed_querry if key in vocabulary.keys()]
+
+        # A phrase with a word missing from the vocabulary cannot match
+        processed_phrases = []
+        for phrase, window in phrases:
+            words = default_analyzer().analyze(phrase)
+            if not all(word in vocabulary for word in words):
+                print("We don't have that in the kitchen!\nChoose something else.")
+                return False
+            processed_phrases.append(([vocabulary[word] for word in words], window))
+            processed_querry += processed_phrases[-1][0]
 
     # Exit if no valid words are found in the query
     if len(processed_querry) == 0:
         print("We don't have that in the kitchen!\nChoose something else.")
         return False
 
+    with metrics.stage("postings"):
         # Retrieve restaurant IDs for each word in the query using the reverse index
-    matching_resturants = [reverse_index[key] for key in processed_querry]
+        matching_resturants = [reverse_index[key] for key in set(processed_querry)]
 
-    # Find common restaurants across all query words
-    matching_resturants = restaurants_matcher(matching_resturants)
+        # Find common restaurants across all query words
+        matching_resturants = restaurants_matcher(matching_resturants)
+
+    # Check the word positions of the phrases, only in the restaurants containing all the words
+    if processed_phrases:
+        with metrics.stage("positions"):
+            for word_ids, window in processed_phrases:
+                if window is None:
+                    matching_resturants = positional.phrase_match(word_ids, matching_resturants)
+                else:
+                    matching_resturants = positional.near_match(word_ids, matching_resturants, window)
+            matching_resturants = matching_resturants.tolist()
 
     # Format and print the results
-    return top_k_printer(matching_resturants, restaurants_df, top_k_to_print)
+    with metrics.stage("render"):
+        return top_k_printer(matching_resturants, restaurants_df, top_k_to_print)
+
+
+# Map a query to vocabulary IDs and rank restaurants with the TF-IDF index
+def rank_query(querry, vocabulary, index, k=None, cache=None, candidates=None, scorer="tfidf"):
+    """
+    Cleans the query and scores it against every restaurant.
+
+    Parameters:
+    - querry: User's search query as a string.
+    - vocabulary: Dictionary mapping words to IDs.
+    - index: TFIDFIndex built from the restaurant descriptions.
+    - k: When given, only the k best restaurants are retrieved (MaxScore early termination).
+    - cache: Optional ResultCache, keyed on the query's term IDs and k (not used with candidates).
+    - candidates: Optional restaurant IDs to restrict the scoring to (e.g. a spatial pre-filter).
+    - scorer: "tfidf" (cosine similarity) or "bm25".
+
+    Returns:
+    - (restaurant IDs, scores) sorted by decreasing score, or None if no query word is known.
+    """
+    index.scorer(scorer)
+    # Words missing from the vocabulary have no postings and cannot contribute to the score
+    with metrics.stage("analyze"):
+        processed_query = [vocabulary[word] for word in default_analyzer().analyze(querry)
+                           if word in vocabulary]
+    if len(processed_query) == 0:
+        return None
+
+    if candidates is not None:
+        with metrics.stage("score"):
+            result_restaurant, result_cosine = index.rank(processed_query, k, candidates, scorer)
+        return result_restaurant.tolist(), result_cosine.tolist()
+
+    if cache is not None:
+        key = make_key(processed_query, k=k, scorer=scorer)
+        cached = cache.get(key, index.generation)
+        if cached is not None:
+            return list(cached[0]), list(cached[1])
+
+    with metrics.stage("score"):
+        if k is None:
+            result_restaurant, result_cosine = index.rank(processed_query, scorer=scorer)
+        else:
+            result_restaurant, result_cosine = index.rank_top_k(processed_query, k, scorer)
+        result_restaurant, result_cosine = result_restaurant.tolist(), result_cosine.tolist()
+
+    if cache is not None:
+        cache.put(key, (tuple(result_restaurant), tuple(result_cosine)), index.generation)
+    return result_restaurant, result_cosine
+
+
+# Rank many queries at once, for offline evaluation and bulk jobs
+def rank_batch(queries, vocabulary, index, k=10):
+    """
+    Ranks a batch of queries with a single sparse matrix-matrix product, without printing anything.
+
+    Parameters:
+    - queries: List of search queries as strings.
+    - vocabulary: Dictionary mapping words to IDs.
+    - index: TFIDFIndex built from the restaurant descriptions.
+    - k: Number of restaurants to return per query.
+
+    Returns:
+    - Two lists with, for each query, the top-k restaurant IDs and cosine scores as NumPy arrays.
+    """
+    queries_term_ids = [[vocabulary[word] for word in words if word in vocabulary]
+                        for words in default_analyzer().analyze_many(queries)]
+    return index.rank_batch(queries_term_ids, k)
 
 
 # Define a function to rank restaurants based on cosine similarity
-def ranked_engine(sample_input, restaurants_df, vocabulary, reverse_index_tf_idf, IDF_by_words, top_k_to_print):
+def ranked_engine(sample_input, restaurants_df, vocabulary, reverse_index_tf_idf, IDF_by_words, top_k_to_print,
+                  index=None, cache=None):
     """
     Ranks restaurants based on cosine similarity between query and restaurant TF-IDF vectors.
 
@@ -60,265 +176,138 @@ def ranked_engine(sample_input, restaurants_df, vocabulary, reverse_index_tf_idf
     - vocabulary: Dictionary mapping words to IDs.
     - reverse_index_tf_idf: Reverse index mapping word IDs to TF-IDF values for each document.
     - IDF_by_words: Dictionary of inverse document frequency (IDF) values for each word.
-    - ID_descritpion: Description IDs mapped to their content.
+    - top_k_to_print: Number of restaurants to display.
+    - index: Optional prebuilt TFIDFIndex; built once from reverse_index_tf_idf when omitted (shared_index).
+    - cache: Optional ResultCache reused across calls with the same index.
 
     Returns:
     - True if matches are found and processed; False otherwise.
     """
-    # Clean and preprocess the query
-    stemmed_querry = cleaner_pipeline(sample_input)
-    processed_query = []
-    # Map query words to vocabulary IDs if they exist
-    for word in stemmed_querry:
-        if word in vocabulary:
-            processed_query.append(vocabulary[word])
-        else:
-            vocabulary[word] = len(vocabulary) + 1
-            processed_query.append(vocabulary[word])
+    # Score the query against every restaurant with the sparse TF-IDF index
+    if index is None:
+        index = shared_index(reverse_index_tf_idf, IDF_by_words, len(restaurants_df))
+    result = rank_query(sample_input, vocabulary, index, k=top_k_to_print, cache=cache)
 
     # Exit if no valid words are found
-    if len(processed_query) == 0:
+    if result is None:
         print("We don't have that in the kitchen!\nChoose something else.")
         return False
-
-    # Calculate TF and IDF for each word in the query
-    query_IDF = {word: IDF_by_words.get(word, 0) for word in processed_query}
-    query_TF = {word: processed_query.count(word) / len(processed_query) for word in processed_query}
-
-    # Compute the TF-IDF vector for the query
-    query_tf_idf = np.zeros(len(vocabulary))  # Initialize vector with zeros
-    for querry_word in processed_query:
-        query_tf_idf[querry_word - 1] = query_TF[querry_word] * query_IDF[querry_word]  # TF-IDF weight
-
-    # Normalize the query vector
-    # query_tf_idf = normalize_vectors(query_tf_idf)
-    # query_tf_idf[query_tf_idf == 0] += 1  # Avoid division by zero errors
-
-    # Get restaurant IDs and their TF-IDF values for matching query words
-    matching_restaurants = {word: reverse_index_tf_idf[word] for word in processed_query if
-                            word in reverse_index_tf_idf}
-
-    # Construct TF-IDF vectors for each document (restaurant)
-    # Construct TF-IDF vectors for each document (restaurant)
-    TF_IDF_matrix = {}
-    vocabulary_index = list(vocabulary.values())
-    for word_id, doc_id_and_tfidf in matching_restaurants.items():
-        for doc_id, tf_idf in doc_id_and_tfidf:
-            if doc_id not in TF_IDF_matrix:
-                TF_IDF_matrix[doc_id] = np.zeros(len(vocabulary))
-            word_index = vocabulary_index.index(word_id)  # Index of the word
-            TF_IDF_matrix[doc_id][word_index] = tf_idf  # Set the TF-IDF value
-
-    # Calculate cosine similarity for each restaurant
-    result_cosine = []
-    for restaurant, tf_idf_vector in TF_IDF_matrix.items():
-        if np.linalg.norm(tf_idf_vector) == 0:  # Handle zero vectors
-            similarity = 0
-        else:
-            tf_idf_vector = normalize_vectors(tf_idf_vector)  # Normalize document vector
-            similarity = cosine_similarity(query_tf_idf.reshape(1, -1), tf_idf_vector.reshape(1, -1))[0][
-                0]  # Cosine similarity
-        result_cosine.append((restaurant, similarity))
-
-    # Sort restaurants by similarity score in descending order
-    result_cosine = sorted(result_cosine, key=lambda x: x[1], reverse=True)
-
-    # Extract restaurant IDs and scores
-    result_restaurant = [tup[0] for tup in result_cosine]
-    result_cosine = [tup[1] for tup in result_cosine]
+    result_restaurant, result_cosine = result
 
     # Format results and display the top matches
-    restaurants_df = restaurants_df.loc[result_restaurant, ["restaurantName", "address", "description", "website"]]
-    restaurants_df["cosine_score"] = result_cosine
-    restaurants_df["description"] = [desc[:47] + "..." if len(desc) > 47 else desc for desc in
-                                     restaurants_df["description"]]
-    if len(restaurants_df) < top_k_to_print: top_k_to_print = len(restaurants_df)
-    print(tabulate(
-        restaurants_df[:top_k_to_print],  # Display top 5 results
-        headers=["Restaurant Name", "Address", "Description", "Website", "Cosine"],
-        tablefmt="rounded_grid",
-        showindex=False,
-        maxcolwidths=25
-    ))
+    with metrics.stage("render"):
+        restaurants_df = restaurants_df.loc[result_restaurant, ["restaurantName", "address", "description", "website"]]
+        restaurants_df["cosine_score"] = result_cosine
+        restaurants_df["description"] = [desc[:47] + "..." if len(desc) > 47 else desc for desc in
+                                         restaurants_df["description"]]
+        if len(restaurants_df) < top_k_to_print: top_k_to_print = len(restaurants_df)
+        print(tabulate(
+            restaurants_df[:top_k_to_print],  # Display top 5 results
+            headers=["Restaurant Name", "Address", "Description", "Website", "Cosine"],
+            tablefmt="rounded_grid",
+            showindex=False,
+            maxcolwidths=25
+        ))
 
     return restaurants_df[:top_k_to_print]
 
 
-def upgraded_ranked_engine(facilities, cusine_types, vocabulary, IDF_by_words, reverse_index_tf_idf, restaurants_df):
+def upgraded_ranked_engine(facilities, cusine_types, vocabulary, IDF_by_words, reverse_index_tf_idf, restaurants_df,
+                           index=None, attributes=None, cache=None):
     
     querry, facility_choosen, cusine, min_money, max_money, k = drop_down_menu(facilities, cusine_types)
 
-    # Clean and preprocess the query
-    stemmed_querry = cleaner_pipeline(querry)
-    processed_query = []
-    # Map query words to vocabulary IDs if they exist
-    for word in stemmed_querry:
-        if word in vocabulary:
-            processed_query.append(vocabulary[word])
-        else:
-            vocabulary[word] = len(vocabulary) + 1
-            processed_query.append(vocabulary[word])
+    # Score the query against every restaurant with the sparse TF-IDF index
+    if index is None:
+        index = shared_index(reverse_index_tf_idf, IDF_by_words, len(restaurants_df))
+    result = rank_query(querry, vocabulary, index, cache=cache)
 
     # Exit if no valid words are found
-    if len(processed_query) == 0:
+    if result is None:
         print("We don't have that in the kitchen!\nChoose something else.")
         return False
+    result_restaurant, result_cosine = result
 
-    # Calculate TF and IDF for each word in the query
-    query_IDF = {word: IDF_by_words.get(word, 0) for word in processed_query}
-    query_TF = {word: processed_query.count(word) / len(processed_query) for word in processed_query}
-
-    # Compute the TF-IDF vector for the query
-    query_tf_idf = np.zeros(len(vocabulary))  # Initialize vector with zeros
-    for querry_word in processed_query:
-        query_tf_idf[querry_word - 1] = query_TF[querry_word] * query_IDF[querry_word]  # TF-IDF weight
-
-    # Normalize the query vector
-    # query_tf_idf = normalize_vectors(query_tf_idf)
-    # query_tf_idf[query_tf_idf == 0] += 1  # Avoid division by zero errors
-
-    # Get restaurant IDs and their TF-IDF values for matching query words
-    matching_restaurants = {word: reverse_index_tf_idf[word] for word in processed_query if
-                            word in reverse_index_tf_idf}
-
-    # Construct TF-IDF vectors for each document (restaurant)
-    # Construct TF-IDF vectors for each document (restaurant)
-    TF_IDF_matrix = {}
-    vocabulary_index = list(vocabulary.values())
-    for word_id, doc_id_and_tfidf in matching_restaurants.items():
-        for doc_id, tf_idf in doc_id_and_tfidf:
-            if doc_id not in TF_IDF_matrix:
-                TF_IDF_matrix[doc_id] = np.zeros(len(vocabulary))
-            word_index = vocabulary_index.index(word_id)  # Index of the word
-            TF_IDF_matrix[doc_id][word_index] = tf_idf  # Set the TF-IDF value
-
-    # Calculate cosine similarity for each restaurant
-    result_cosine = []
-    for restaurant, tf_idf_vector in TF_IDF_matrix.items():
-        if np.linalg.norm(tf_idf_vector) == 0:  # Handle zero vectors
-            similarity = 0
-        else:
-            tf_idf_vector = normalize_vectors(tf_idf_vector)  # Normalize document vector
-            similarity = cosine_similarity(query_tf_idf.reshape(1, -1), tf_idf_vector.reshape(1, -1))[0][
-                0]  # Cosine similarity
-        result_cosine.append((restaurant, similarity))
-
-    # Sort restaurants by similarity score in descending order
-    result_cosine = sorted(result_cosine, key=lambda x: x[1], reverse=True)
-
-    # Extract restaurant IDs and scores
-    result_restaurant = [tup[0] for tup in result_cosine]
-    result_cosine = [tup[1] for tup in result_cosine]
+    # Boost the matches satisfying the user's preferences and keep the k best
+    if attributes is None:
+        attributes = AttributeStore.from_dataframe(restaurants_df)
+    with metrics.stage("boost"):
+        boosted_cosine = attributes.boost(result_restaurant, result_cosine, facility_choosen, cusine, min_money, max_money)
+        best_ids, best_cosine = top_k(result_restaurant, boosted_cosine, k)
 
     # Format results and display the top matches
-    restaurants_df = restaurants_df.loc[result_restaurant]
-    restaurants_df["cosine_score"] = pd.Series(result_cosine, index=result_restaurant).values
-    restaurants_df["description"] = [desc[:47] + "..." if len(desc) > 47 else desc for desc in
-                                     restaurants_df["description"]]
-    if len(restaurants_df) < k: k = len(restaurants_df)
-    best_restaurants = upgrade_TF_IDF_score(restaurants_df, facility_choosen, cusine, min_money, max_money, k)[
-        ["restaurantName", "address", "description", "website", "cosine_score", "priceRange"]]
-    price_range = list(best_restaurants.priceRange)
-    best_restaurants = best_restaurants.drop("priceRange", axis=1)
-
-    if best_restaurants.empty:
-        print("No results to display")
-        return best_restaurants, []
-
-    print(tabulate(
-        best_restaurants,  # Display top 5 results
-        headers=["Restaurant Name", "Address", "Description", "Website", "adjusted_Cosine"],
-        tablefmt="rounded_grid",
-        showindex=False,
-        maxcolwidths=25
-    ))
+    with metrics.stage("render"):
+        best_restaurants = restaurants_df.loc[best_ids, ["restaurantName", "address", "description", "website", "priceRange"]]
+        best_restaurants["cosine_score"] = best_cosine
+        best_restaurants["description"] = [desc[:47] + "..." if len(desc) > 47 else desc for desc in
+                                           best_restaurants["description"]]
+        price_range = list(best_restaurants.priceRange)
+        best_restaurants = best_restaurants.drop("priceRange", axis=1)
+
+        if best_restaurants.empty:
+            print("No results to display")
+            return best_restaurants, []
+
+        print(tabulate(
+            best_restaurants,  # Display top 5 results
+            headers=["Restaurant Name", "Address", "Description", "Website", "adjusted_Cosine"],
+            tablefmt="rounded_grid",
+            showindex=False,
+            maxcolwidths=25
+        ))
 
     return best_restaurants, price_range
 
 
-def advanced_ranked_engine(facilities, cusine_types, regions, credit_cards, vocabulary, IDF_by_words, reverse_index_tf_idf, restaurants_df):
+def advanced_ranked_engine(facilities, cusine_types, regions, credit_cards, vocabulary, IDF_by_words, reverse_index_tf_idf, restaurants_df,
+                           index=None, attributes=None, cache=None, planner=None):
     
     
     querry, facility_choosen, cusine, min_money, max_money, k, regions, credit_cards = advanced_drop_down_menu(facilities, cusine_types, regions, credit_cards)
 
-    # Clean and preprocess the query
-    stemmed_querry = cleaner_pipeline(querry)
-    processed_query = []
-    # Map query words to vocabulary IDs if they exist
-    for word in stemmed_querry:
-        if word in vocabulary:
-            processed_query.append(vocabulary[word])
-        else:
-            vocabulary[word] = len(vocabulary) + 1
-            processed_query.append(vocabulary[word])
+    # Map the query to vocabulary IDs, words missing from the vocabulary cannot match
+    with metrics.stage("analyze"):
+        processed_query = [vocabulary[word] for word in default_analyzer().analyze(querry) if word in vocabulary]
 
     # Exit if no valid words are found
     if len(processed_query) == 0:
         print("We don't have that in the kitchen!\nChoose something else.")
         return False
 
-    # Calculate TF and IDF for each word in the query
-    query_IDF = {word: IDF_by_words.get(word, 0) for word in processed_query}
-    query_TF = {word: processed_query.count(word) / len(processed_query) for word in processed_query}
-
-    # Compute the TF-IDF vector for the query
-    query_tf_idf = np.zeros(len(vocabulary))  # Initialize vector with zeros
-    for querry_word in processed_query:
-        query_tf_idf[querry_word - 1] = query_TF[querry_word] * query_IDF[querry_word]  # TF-IDF weight
-
-
-    # Get restaurant IDs and their TF-IDF values for matching query words
-    matching_restaurants = {word: reverse_index_tf_idf[word] for word in processed_query if
-                            word in reverse_index_tf_idf}
-
-    # Construct TF-IDF vectors for each document (restaurant)
-    TF_IDF_matrix = {}
-    vocabulary_index = list(vocabulary.values())
-    for word_id, doc_id_and_tfidf in matching_restaurants.items():
-        for doc_id, tf_idf in doc_id_and_tfidf:
-            if doc_id not in TF_IDF_matrix:
-                TF_IDF_matrix[doc_id] = np.zeros(len(vocabulary))
-            word_index = vocabulary_index.index(word_id)  # Index of the word
-            TF_IDF_matrix[doc_id][word_index] = tf_idf  # Set the TF-IDF value
-
-    # Calculate cosine similarity for each restaurant
-    result_cosine = []
-    for restaurant, tf_idf_vector in TF_IDF_matrix.items():
-        if np.linalg.norm(tf_idf_vector) == 0:  # Handle zero vectors
-            similarity = 0
-        else:
-            tf_idf_vector = normalize_vectors(tf_idf_vector)  # Normalize document vector
-            similarity = cosine_similarity(query_tf_idf.reshape(1, -1), tf_idf_vector.reshape(1, -1))[0][
-                0]  # Cosine similarity
-        result_cosine.append((restaurant, similarity))
-
-    # Sort restaurants by similarity score in descending order
-    result_cosine = sorted(result_cosine, key=lambda x: x[1], reverse=True)
-
-    # Extract restaurant IDs and scores
-    result_restaurant = [tup[0] for tup in result_cosine]
-    result_cosine = [tup[1] for tup in result_cosine]
+    # Keep the matches in the chosen region accepting the chosen cards: the planner applies these
+    # filters before the scoring when they are selective enough, after it otherwise
+    if planner is None:
+        if index is None:
+            index = shared_index(reverse_index_tf_idf, IDF_by_words, len(restaurants_df))
+        if attributes is None:
+            attributes = AttributeStore.from_dataframe(restaurants_df)
+        planner = QueryPlanner(index, attributes, cache)
+    with metrics.stage("retrieve"):
+        result_restaurant, result_cosine, _ = planner.execute(processed_query, regions, credit_cards)
+
+    # Boost the matches satisfying the user's preferences and keep the k best
+    with metrics.stage("boost"):
+        boosted_cosine = planner.attributes.boost(result_restaurant, result_cosine, facility_choosen, cusine,
+                                                  min_money, max_money)
+        best_ids, best_cosine = top_k(result_restaurant, boosted_cosine, k)
 
     # Format results and display the top matches
-    restaurants_df = restaurants_df.loc[result_restaurant]
-    restaurants_df["cosine_score"] = pd.Series(result_cosine, index=result_restaurant).values
-    restaurants_df["description"] = [desc[:47] + "..." if len(desc) > 47 else desc for desc in
-                                     restaurants_df["description"]]
-    if len(restaurants_df) < k: k = len(restaurants_df)
-    best_restaurants = advanced_upgrade_TF_IDF_score(restaurants_df, facility_choosen, cusine, min_money, max_money, k, regions, credit_cards)[
-        ["restaurantName", "address", "description", "priceRange", "website", "cosine_score"]]
-    best_restaurants = best_restaurants.drop("priceRange", axis=1)
-
-    if best_restaurants.empty:
-        print("No results to display")
-        return best_restaurants, []
-
-    print(tabulate(
-        best_restaurants,  # Display top 5 results
-        headers=["Restaurant Name", "Address", "Description", "priceRange", "Website", "Cosine"],
-        tablefmt="rounded_grid",
-        showindex=False,
-        maxcolwidths=25
-    ))
+    with metrics.stage("render"):
+        best_restaurants = restaurants_df.loc[best_ids, ["restaurantName", "address", "description", "website"]]
+        best_restaurants["cosine_score"] = best_cosine
+        best_restaurants["description"] = [desc[:47] + "..." if len(desc) > 47 else desc for desc in
+                                           best_restaurants["description"]]
+
+        if best_restaurants.empty:
+            print("No results to display")
+            return best_restaurants, []
+
+        print(tabulate(
+            best_restaurants,  # Display top 5 results
+            headers=["Restaurant Name", "Address", "Description", "Website", "Cosine"],
+            tablefmt="rounded_grid",
+            showindex=False,
+            maxcolwidths=25
+        ))
 
     return best_restaurants
\ No newline at end of file
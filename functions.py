@@ -1,16 +1,12 @@
-import pandas as pd
-import re
-from math import log
-from nltk.stem import PorterStemmer
-from nltk.corpus import stopwords
-# Uncomment to download stopwords if they are not available
-# nltk.download('stopwords')
+from collections import Counter
+from analyzer import default_analyzer
+from attributes import AttributeStore, parse_list
+from postings import CompressedReverseIndex, intersect_postings
 from tabulate import tabulate
 import numpy as np
 from math import log10
 import ipywidgets as widgets
 from IPython.display import display
-import heapq
 from jupyter_ui_poll import ui_events
 import time
 
@@ -23,28 +19,8 @@ def cleaner_pipeline(query):
     - Converts text to lowercase.
     - Removes stopwords and applies stemming.
     """
-    # Load a set of English stopwords to filter out common words
-    stop_words = set(stopwords.words("english"))
-
-    # Initialize a stemmer to reduce words to their root forms
-    stemmer = PorterStemmer()
-
-    # Remove non-alphanumeric characters
-    query = re.sub(r"[^a-zA-Z0-9]", " ", query)
-
-    # Replace multiple spaces with a single space
-    query = re.sub(r" +", " ", query)
-
-    # Convert to lowercase
-    query = query.lower()
-
-    # Tokenize, remove stopwords, and trim whitespace
-    query = [word.strip() for word in query.split(" ") if word.strip() not in stop_words]
-
-    # Apply stemming to each word
-    processed_query = [stemmer.stem(word) for word in query]
-
-    return processed_query
+    # The shared analyzer keeps the stopwords, the stemmer and a cache of stems between calls
+    return default_analyzer().analyze(query)
 
 
 # Clean a list of descriptions
@@ -52,29 +28,24 @@ def description_cleaner(descriptions):
     """
     Applies the cleaner_pipeline to a list of descriptions.
     """
-    result = []
-    for description in descriptions:
-        stemmed_words = cleaner_pipeline(description)
-        result.append(stemmed_words)
-    return result
+    return default_analyzer().analyze_many(descriptions)
 
 
 # Create a vocabulary from descriptions
 def vocabulary_creator(descriptions):
     """
     Builds a unique vocabulary from the processed descriptions.
-    Assigns a unique ID to each word.
+    Assigns a unique ID to each word, in sorted word order so IDs are the same on every run.
     """
     # Initialize a set of unique words
     unique_words = set(descriptions[0])
     for description in descriptions[1:]:
         unique_words |= set(description)
 
-    # Assign unique IDs to each word
+    # Assign unique IDs to each word, skipping empty strings
     vocab = {}
-    for counter, word in enumerate(unique_words):
-        if word:  # Skip empty strings
-            vocab[word] = counter
+    for counter, word in enumerate(sorted(word for word in unique_words if word)):
+        vocab[word] = counter
 
     return word_to_id(descriptions, vocab)
 
@@ -93,16 +64,22 @@ def word_to_id(descriptions, vocab):
 
 
 # Create a reverse index mapping words to documents
-def reverse_index_creator(ID_descriptions):
+def reverse_index_creator(ID_descriptions, compressed=False):
     """
     Creates a reverse index mapping word IDs to the document IDs where they appear.
+    Each postings list is a sorted uint32 array without duplicates.
+    With compressed=True the postings are kept delta + varint encoded (CompressedReverseIndex)
+    and decoded only when a word is looked up.
     """
     reverse_index = {}
     for doc_id, word_ids in ID_descriptions.items():
-        for word_id in word_ids:
+        for word_id in set(word_ids):
             if word_id not in reverse_index:
                 reverse_index[word_id] = []
             reverse_index[word_id].append(doc_id)
+    reverse_index = {word_id: np.unique(np.asarray(doc_ids, dtype=np.uint32)) for word_id, doc_ids in reverse_index.items()}
+    if compressed:
+        return CompressedReverseIndex(reverse_index)
     return reverse_index
 
 
@@ -110,25 +87,21 @@ def reverse_index_creator(ID_descriptions):
 def restaurants_matcher(matching_restaurants):
     """
     Finds restaurants that match based on the intersection of word IDs.
+    Postings are intersected smallest first, skipping through the longer lists by binary search.
     """
-    matches = set(matching_restaurants[0])
-    for restaurant in matching_restaurants[1:]:
-        matches &= set(restaurant)
-    return list(matches)
+    return intersect_postings(matching_restaurants).tolist()
 
 
 # Compute term frequency (TF)
 def compute_TF(descriptions):
     """
     Computes the term frequency (TF) for each word in each description.
+    Words are counted in a single pass, and each distinct word gets one (word, TF) pair.
     """
     TF_res = {}
     for index, description in descriptions.items():
-        if index not in TF_res:
-            TF_res[index] = []
         total_words = len(description)
-        for word in description:
-            TF_res[index].append((word, description.count(word) / total_words))
+        TF_res[index] = [(word, count / total_words) for word, count in Counter(description).items()]
     return TF_res
 
 
@@ -138,8 +111,13 @@ def compute_IDF(reverse_index, total_documents):
     Computes the inverse document frequency (IDF) for each word ID.
     """
     result_IDF = {}
-    for word, doc_list in reverse_index.items():
-        idf_value = log10(total_documents / len(doc_list))
+    # A compressed reverse index knows the length of its postings without decoding them
+    if isinstance(reverse_index, CompressedReverseIndex):
+        document_frequencies = reverse_index.lengths.items()
+    else:
+        document_frequencies = ((word, len(doc_list)) for word, doc_list in reverse_index.items())
+    for word, document_frequency in document_frequencies:
+        idf_value = log10(total_documents / document_frequency)
         result_IDF[word] = idf_value
     return result_IDF
 
@@ -159,6 +137,23 @@ def compute_TF_IDF(tf_dict, idf_dict):
     return tf_idf_result
 
 
+# Select the k best scores without sorting all of them
+def top_k(doc_ids, scores, k=None):
+    """
+    Returns the ids and scores of the k highest scores, best first; ties are broken by id.
+    All of them are returned, sorted, when k is None.
+    """
+    doc_ids = np.asarray(doc_ids)
+    scores = np.asarray(scores)
+    if k is not None and k < len(scores):
+        if k <= 0:
+            return doc_ids[:0], scores[:0]
+        selected = np.argpartition(-scores, k - 1)[:k]
+        doc_ids, scores = doc_ids[selected], scores[selected]
+    order = np.lexsort((doc_ids, -scores))
+    return doc_ids[order], scores[order]
+
+
 # Display top-k matching restaurants
 def top_k_printer(matching_restaurants, restaurants_df, top_k_to_print):
     """
@@ -284,51 +279,39 @@ def drop_down_menu(facilities, cusine_types):
 
 
 def extract_facilities(faci):
-    res_facility = set()
-    for restourant_facilities in faci:
-        restourant_facilities = restourant_facilities.lower()
-        restourant_facilities = re.sub(r"[\[\]\']", " ", restourant_facilities)
-        restourant_facilities = re.sub(r" +", " ", restourant_facilities)
-        res_facility |= set(restourant_facilities.split(", ")) 
-    return list(res_facility)
+    """
+    Lowercased items of a list attribute, whether stored as a list or as its string form.
+    """
+    return parse_list(faci)
 
 
-def upgrade_TF_IDF_score(restaurants_df, facility_choosen, cusine_choosen, min_money, max_money, k):
+def upgrade_TF_IDF_score(restaurants_df, facility_choosen, cusine_choosen, min_money, max_money, k, attributes=None):
     '''
-    priceRange
-    cuisineType
-    facilitiesServices
-    cosine_score
-    ["Restaurant Name", "Address", "Description", "Website", "Cosine"]
+    Adds 0.2 to the cosine_score of the candidate restaurants for a priceRange within
+    [min_money, max_money] and for each chosen cuisineType and facilitiesServices they match,
+    then returns the k best, sorted by the new cosine_score.
+    The attributes come from the AttributeStore (rows = restaurant IDs = restaurants_df.index)
+    when given, otherwise they are parsed from restaurants_df.
     '''
-    top_k_heap = []
-    new_cosine = []
-    for i, (index, row) in enumerate(restaurants_df.iterrows()):
-        cost = extract_facilities(row["priceRange"])
-        cusine = extract_facilities(row["cuisineType"])
-        facility = extract_facilities(row["facilitiesServices"])
-        cosine_score = row.cosine_score
-        # print("Money :", cost.count("€"), min_money, max_money, sep=" ")
-        # print("cost before :", cosine_score)
-        if cost.count("€") >= min_money and cost.count("€") <= max_money:
-            cosine_score += 0.2
-        # print(set(cusine_choosen)&set(cusine))
-        cosine_score += 0.2 * len(set(cusine_choosen) & set(cusine))
-        # print(set(facility_choosen)&set(facility))
-        cosine_score += 0.2 * len(set(facility_choosen) & set(facility))
-
-        new_cosine.append(cosine_score)
-
-        if len(top_k_heap) < k:
-            heapq.heappush(top_k_heap, (cosine_score, i))
-        else:
-            if cosine_score > top_k_heap[0][0]:  # Compare with the smallest element in the heap
-                heapq.heapreplace(top_k_heap, (cosine_score, i))  # Replace the smallest directly
-
-        # print("cosine after: ", cosine_score, end="\n\n")
-    restaurants_df["cosine_score"] = new_cosine
-    to_return = [tup[1] for tup in top_k_heap]
-    return restaurants_df.iloc[to_return].sort_values(by="cosine_score", ascending=False)
+    attributes, doc_ids = candidate_attributes(restaurants_df, attributes)
+    return boosted_top_k(restaurants_df, attributes, doc_ids, facility_choosen, cusine_choosen, min_money, max_money, k)
+
+
+# Attribute rows of the candidate restaurants
+def candidate_attributes(restaurants_df, attributes):
+    if attributes is None:
+        return AttributeStore.from_dataframe(restaurants_df), np.arange(len(restaurants_df))
+    return attributes, restaurants_df.index.to_numpy()
+
+
+# Boost the candidates' cosine_score and keep the k best
+def boosted_top_k(restaurants_df, attributes, doc_ids, facility_choosen, cusine_choosen, min_money, max_money, k):
+    new_cosine = attributes.boost(doc_ids, restaurants_df["cosine_score"].to_numpy(), facility_choosen,
+                                  cusine_choosen, min_money, max_money)
+    best_rows, best_cosine = top_k(np.arange(len(restaurants_df)), new_cosine, k)
+    restaurants_df = restaurants_df.iloc[best_rows].copy()
+    restaurants_df["cosine_score"] = best_cosine
+    return restaurants_df
 
 
 def advanced_drop_down_menu(facilities, cusine_types, regions, credit_cards):
@@ -438,50 +421,13 @@ def advanced_drop_down_menu(facilities, cusine_types, regions, credit_cards):
 
 
 
-def advanced_upgrade_TF_IDF_score(restaurants_df, facility_choosen, cusine_choosen, min_money, max_money, k, regions, credit_cards):
+def advanced_upgrade_TF_IDF_score(restaurants_df, facility_choosen, cusine_choosen, min_money, max_money, k, regions, credit_cards,
+                                  attributes=None):
     '''
-    priceRange
-    cuisineType
-    facilitiesServices
-    cosine_score
-    ["Restaurant Name", "Address", "Description", "Website", "Cosine"]
+    Same as upgrade_TF_IDF_score, but first drops the restaurants outside the chosen region
+    or accepting none of the chosen credit cards.
     '''
-    top_k_heap = []
-    new_cosine = []
-    for i, (index, row) in enumerate(restaurants_df.iterrows()):
-        cost = extract_facilities(row["priceRange"])
-        cusine = extract_facilities(row["cuisineType"])
-        facility = extract_facilities(row["facilitiesServices"])
-        row_region = row["region"]
-        cards = extract_facilities(row["creditCards"])
-        cosine_score = row.cosine_score
-
-        if row_region != regions:
-            continue
-        
-        if len(set(cards) & set(cards)) == 0:
-            continue
-
-
-        if cost.count("€") >= min_money and cost.count("€") <= max_money:
-            cosine_score += 0.2
-        # print(set(cusine_choosen)&set(cusine))
-        cosine_score += 0.2 * len(set(cusine_choosen) & set(cusine))
-        # print(set(facility_choosen)&set(facility))
-        cosine_score += 0.2 * len(set(facility_choosen) & set(facility))
-
-
-
-        new_cosine.append(cosine_score)
-
-        if len(top_k_heap) < k:
-            heapq.heappush(top_k_heap, (cosine_score, i))
-        else:
-            if cosine_score > top_k_heap[0][0]:  # Compare with the smallest element in the heap
-                heapq.heapreplace(top_k_heap, (cosine_score, i))  # Replace the smallest directly
-
-        # print("cosine after: ", cosine_score, end="\n\n")
-    restaurants_df = restaurants_df.iloc[ [tup[1] for tup in top_k_heap]]
-    restaurants_df["cosine_score"] = [tup[0] for tup in top_k_heap]
-
-    return restaurants_df.sort_values(by="cosine_score", ascending=False)
\ No newline at end of file
+    attributes, doc_ids = candidate_attributes(restaurants_df, attributes)
+    kept = attributes.filter(doc_ids, regions, credit_cards)
+    return boosted_top_k(restaurants_df[kept], attributes, doc_ids[kept], facility_choosen, cusine_choosen,
+                         min_money, max_money, k)
@@ -1,5 +1,12 @@
+import argparse
 import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import pandas as pd
 import requests
 from dotenv import load_dotenv
 
@@ -7,24 +14,248 @@ load_dotenv()
 
 api_key = os.getenv("API_KEY")
 
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+GEOCODE_CACHE_FILE = "geocode_cache.sqlite"
+# (country, city) pairs looked up per query, two parameters each (older SQLite allow 999 parameters)
+CACHE_LOOKUP_BATCH = 400
+
+# Google statuses meaning "try again later" rather than "this city has no answer"
+RETRY_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+
+# The geocoding service refused the request for now (quota, rate limit or server error)
+class GeocodeRetryError(Exception):
+    pass
+
+
+# Google Geocoding API; any object with the same geocode(city, country) method can replace it
+class GoogleGeocoder:
+    def __init__(self, key=None, country="Italy", timeout=10):
+        self.key = key or api_key
+        self.country = country
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def session(self):
+        # one keep-alive session per worker thread
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def geocode(self, city, country=None):
+        """
+        Returns (region, latitude, longitude), with None values when the city is not found.
+        The country defaults to the one of the geocoder.
+        Raises GeocodeRetryError when the request should be retried later.
+        """
+        params = {"address": f"{city},{country or self.country}", "key": self.key}
+        try:
+            response = self.session().get(GEOCODE_URL, params=params, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise GeocodeRetryError(str(e))
+        if response.status_code == 429 or response.status_code >= 500:
+            raise GeocodeRetryError(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        data = response.json()
+
+        if data['status'] in RETRY_STATUSES:
+            raise GeocodeRetryError(data['status'])
+        if data['status'] == "REQUEST_DENIED":
+            raise RuntimeError(data.get('error_message', "Geocoding request denied"))
+
+        region = None
+        latitude = None
+        longitude = None
+
+        if data['status'] == "OK":
+            location = data['results'][0]['geometry']['location']
+            latitude = location['lat']
+            longitude = location['lng']
+
+            for component in data['results'][0]['address_components']:
+                if "administrative_area_level_1" in component['types']:
+                    region = component['long_name']
+                    break
+
+        return region, latitude, longitude
+
+
+# Offline geocoder answering from a table of the cities of one country, e.g. italy_cities_regions.tsv
+class TableGeocoder:
+    def __init__(self, cities_df, country="Italy"):
+        self.country = country
+        self.cities = {normalize_city(row.city): (row.region, row.latitude, row.longitude)
+                       for row in cities_df.itertuples()}
+
+    def geocode(self, city, country=None):
+        if country is not None and normalize_city(country) != normalize_city(self.country):
+            return None, None, None
+        return self.cities.get(normalize_city(city), (None, None, None))
+
 
 def get_region_and_coordinates(city):
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?address={city},Italy&key={api_key}"
-    response = requests.get(url)
-    data = response.json()
+    return GoogleGeocoder().geocode(city)
+
+
+def normalize_city(city):
+    return " ".join(str(city).split()).title()
+
+
+# Name of a geocoder as recorded in the cache
+def geocoder_name(geocoder):
+    return type(geocoder).__name__
+
+
+# Results of previous runs, one row per (country, city) with the geocoder that produced it
+class GeocodeCache:
+    """
+    A city that was found is reused whatever geocoder found it. A city that was not found is only
+    reused by the same geocoder: a miss of the offline table is asked again to Google.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS places "
+                                "(country TEXT, city TEXT, region TEXT, latitude REAL, longitude REAL, geocoder TEXT, "
+                                "PRIMARY KEY (country, city))")
+
+    def get_many(self, places, geocoder):
+        """
+        Looks the places up by primary key, CACHE_LOOKUP_BATCH pairs per query.
+        """
+        places = list(places)
+        rows = []
+        with self.lock:
+            for start in range(0, len(places), CACHE_LOOKUP_BATCH):
+                batch = places[start:start + CACHE_LOOKUP_BATCH]
+                values = ", ".join(["(?, ?)"] * len(batch))
+                # Joining from the wanted pairs probes the primary key once per pair (an IN list scans the table)
+                rows += self.connection.execute(
+                    f"WITH wanted(country, city) AS (VALUES {values}) "
+                    "SELECT places.country, places.city, region, latitude, longitude, geocoder "
+                    "FROM wanted CROSS JOIN places ON places.country = wanted.country AND places.city = wanted.city",
+                    [value for place in batch for value in place]).fetchall()
+        return {(country, city): (region, latitude, longitude)
+                for country, city, region, latitude, longitude, source in rows
+                if latitude is not None or source == geocoder}
+
+    def put(self, place, result, geocoder):
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO places VALUES (?, ?, ?, ?, ?, ?)",
+                                    (*place, *result, geocoder))
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+# Spread the requests of all the worker threads to at most `rate` per second
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def resolve_city(geocoder, place, rate_limiter, retries, backoff):
+    country, city = place
+    for attempt in range(retries + 1):
+        rate_limiter.wait()
+        try:
+            return geocoder.geocode(city, country)
+        except GeocodeRetryError:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+# Geocode every distinct (country, city) once, reusing the cached results
+def geocode_cities(places, geocoder=None, cache_file=GEOCODE_CACHE_FILE, workers=4, rate=10.0, retries=3, backoff=1.0):
+    """
+    places: (country, city) pairs. Returns {(country, city): (region, latitude, longitude)} for the
+    distinct, normalized pairs.
+    Places missing from the cache are resolved concurrently, at most `rate` requests per second;
+    places that still fail after the retries are left out and not cached, so the next run tries them again.
+    A denied request (RuntimeError) cancels the pending requests and is raised.
+    """
+    geocoder = geocoder or GoogleGeocoder()
+    source = geocoder_name(geocoder)
+    places = sorted({(normalize_city(country), normalize_city(city)) for country, city in places
+                     if isinstance(country, str) and isinstance(city, str) and city.strip()})
+    cache = GeocodeCache(cache_file) if cache_file else None
+    results = cache.get_many(places, source) if cache is not None else {}
+    missing = [place for place in places if place not in results]
+    print(f"{len(places)} cities: {len(results)} cached, {len(missing)} to geocode")
+
+    rate_limiter = RateLimiter(rate)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            future_to_place = {executor.submit(resolve_city, geocoder, place, rate_limiter, retries, backoff): place
+                               for place in missing}
+            for future in as_completed(future_to_place):
+                place = future_to_place[future]
+                try:
+                    results[place] = future.result()
+                except GeocodeRetryError as e:
+                    print(f"Error with {place[1]}: {e}")
+                    continue
+                except RuntimeError:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+                if cache is not None:
+                    cache.put(place, results[place], source)
+    finally:
+        if cache is not None:
+            cache.close()
+    return results
+
+
+# Add the region and the coordinates of the city to every restaurant
+def geocode_restaurants(restaurants_df, geocoder=None, cache_file=GEOCODE_CACHE_FILE, **options):
+    """
+    Restaurants without a country column are looked up in the country of the geocoder.
+    """
+    geocoder = geocoder or GoogleGeocoder()
+    if "country" in restaurants_df.columns:
+        countries = [country if isinstance(country, str) else geocoder.country for country in restaurants_df["country"]]
+    else:
+        countries = [geocoder.country] * len(restaurants_df)
+    places = list(zip(countries, restaurants_df["city"]))
+    results = geocode_cities(places, geocoder, cache_file, **options)
+    located = [results.get((normalize_city(country), normalize_city(city)), (None, None, None))
+               if isinstance(city, str) else (None, None, None) for country, city in places]
+    restaurants_df = restaurants_df.copy()
+    restaurants_df["region"] = [region for region, _, _ in located]
+    restaurants_df["latitude"] = [latitude for _, latitude, _ in located]
+    restaurants_df["longitude"] = [longitude for _, _, longitude in located]
+    return restaurants_df
+
 
-    region = None
-    latitude = None
-    longitude = None
+def main():
+    parser = argparse.ArgumentParser(description="Add region and coordinates to the restaurants")
+    parser.add_argument("--restaurants", default="restaurants_i.tsv")
+    parser.add_argument("--output", default="restaurants_i.tsv")
+    parser.add_argument("--cache", default=GEOCODE_CACHE_FILE)
+    parser.add_argument("--cities", default=None, help="geocode offline from a TSV of city, region, latitude, longitude")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=10.0, help="requests per second")
+    args = parser.parse_args()
 
-    if data['status'] == "OK":
-        location = data['results'][0]['geometry']['location']
-        latitude = location['lat']
-        longitude = location['lng']
+    geocoder = TableGeocoder(pd.read_csv(args.cities, sep="\t")) if args.cities else GoogleGeocoder()
+    restaurants_df = pd.read_csv(args.restaurants, sep="\t")
+    restaurants_df = geocode_restaurants(restaurants_df, geocoder, args.cache, workers=args.workers, rate=args.rate)
+    restaurants_df.to_csv(args.output, index=False, encoding="utf-8", sep="\t")
+    print(f"Located {restaurants_df['region'].notna().sum()} of {len(restaurants_df)} restaurants")
 
-        for component in data['results'][0]['address_components']:
-            if "administrative_area_level_1" in component['types']:
-                region = component['long_name']
-                break
 
-    return region, latitude, longitude
+if __name__ == "__main__":
+    main()
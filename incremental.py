@@ -0,0 +1,261 @@
+from collections import Counter
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+from analyzer import default_analyzer
+from bm25 import BM25Scorer
+from functions import top_k
+from index import TFIDFIndex, new_generation
+
+
+# Immutable batch of documents of the incremental index
+class Segment:
+    """
+    Term counts of a batch of restaurants (one row per restaurant). Only the live mask
+    changes after creation: deleting a restaurant just clears its flag.
+    """
+
+    def __init__(self, doc_ids, term_counts, lengths):
+        self.doc_ids = doc_ids
+        self.term_counts = term_counts
+        self.lengths = lengths
+        self.live = np.ones(len(doc_ids), dtype=bool)
+        self._term_columns = None
+        self._norms = None
+        self._norms_generation = None
+
+    @property
+    def live_count(self):
+        return int(self.live.sum())
+
+    @property
+    def term_columns(self):
+        """
+        Column-major copy of the term counts, so the postings of a term are a contiguous slice.
+        """
+        if self._term_columns is None:
+            self._term_columns = self.term_counts.tocsc()
+        return self._term_columns
+
+    def norms(self, idf, generation):
+        """
+        L2 norm of each restaurant's TF-IDF vector; recomputed only when the IDF has changed.
+        """
+        if self._norms_generation != generation:
+            idf = idf[:self.term_counts.shape[1]]
+            squared = self.term_counts.multiply(self.term_counts) @ (idf ** 2)
+            lengths = np.maximum(self.lengths, 1)
+            self._norms = np.sqrt(squared) / lengths
+            self._norms_generation = generation
+        return self._norms
+
+
+# TF-IDF index that supports adding, updating and deleting restaurants
+class IncrementalIndex:
+    """
+    Segment-based index: new restaurants go to an in-memory buffer that is flushed into an
+    immutable segment, deletions are tombstones, and small segments are merged together.
+    Document frequencies are kept up to date on every change, while the IDF and the
+    document norms are only recomputed when a query needs them.
+    """
+
+    def __init__(self, analyzer=None, buffer_size=1000, max_segments=8):
+        self.analyzer = analyzer if analyzer is not None else default_analyzer()
+        self.buffer_size = buffer_size
+        self.max_segments = max_segments
+        self.vocabulary = {}
+        self.segments = []
+        self.buffer = {}
+        self.locations = {}
+        self.document_frequency = np.zeros(0, dtype=np.int64)
+        # Renewed on every change, so cached results can be invalidated
+        self.generation = new_generation()
+        self._idf = None
+        self._idf_generation = None
+
+    @classmethod
+    def from_descriptions(cls, descriptions, **kwargs):
+        """
+        Builds an incremental index holding the descriptions, with the list positions as IDs.
+        """
+        index = cls(**kwargs)
+        for doc_id, description in enumerate(descriptions):
+            index.add_document(doc_id, description)
+        index.flush()
+        return index
+
+    @property
+    def total_documents(self):
+        return len(self.buffer) + len(self.locations)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.buffer or doc_id in self.locations
+
+    def add_document(self, doc_id, description):
+        """
+        Indexes a new restaurant description under doc_id.
+        """
+        if doc_id in self:
+            raise KeyError(f"Restaurant {doc_id} is already indexed, use update_document")
+
+        words = [word for word in self.analyzer.analyze(description) if word]
+        for word in words:
+            if word not in self.vocabulary:
+                self.vocabulary[word] = len(self.vocabulary)
+        if len(self.vocabulary) > len(self.document_frequency):
+            self.document_frequency = np.concatenate(
+                [self.document_frequency, np.zeros(len(self.vocabulary) - len(self.document_frequency), dtype=np.int64)])
+
+        counts = Counter(self.vocabulary[word] for word in words)
+        term_ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        self.document_frequency[term_ids] += 1
+        self.buffer[doc_id] = (term_ids, np.fromiter(counts.values(), dtype=np.float64, count=len(counts)), len(words))
+        self._changed()
+
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def delete_document(self, doc_id):
+        """
+        Removes a restaurant from the index.
+        """
+        if doc_id in self.buffer:
+            term_ids, _, _ = self.buffer.pop(doc_id)
+        elif doc_id in self.locations:
+            segment, row = self.locations.pop(doc_id)
+            segment.live[row] = False
+            counts = segment.term_counts
+            term_ids = counts.indices[counts.indptr[row]:counts.indptr[row + 1]]
+        else:
+            raise KeyError(f"Restaurant {doc_id} is not indexed")
+        self.document_frequency[term_ids] -= 1
+        self._changed()
+
+    def update_document(self, doc_id, description):
+        """
+        Replaces the description of an indexed restaurant.
+        """
+        self.delete_document(doc_id)
+        self.add_document(doc_id, description)
+
+    def flush(self):
+        """
+        Moves the buffered restaurants into a new segment, then merges segments if there are too many.
+        """
+        if not self.buffer:
+            return
+        doc_ids = np.fromiter(self.buffer.keys(), dtype=np.int64, count=len(self.buffer))
+        rows, cols, values, lengths = [], [], [], []
+        for row, (term_ids, counts, length) in enumerate(self.buffer.values()):
+            rows.append(np.full(len(term_ids), row))
+            cols.append(term_ids)
+            values.append(counts)
+            lengths.append(length)
+        term_counts = csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                                 shape=(len(doc_ids), len(self.vocabulary)))
+        self._add_segment(Segment(doc_ids, term_counts, np.asarray(lengths, dtype=np.float64)))
+        self.buffer = {}
+        self._maybe_merge()
+
+    def merge_segments(self, segments=None):
+        """
+        Merges segments (all of them by default) into one, dropping deleted restaurants.
+        """
+        segments = self.segments if segments is None else segments
+        if len(segments) < 2 and all(segment.live.all() for segment in segments):
+            return
+        total_terms = len(self.vocabulary)
+        parts = []
+        for segment in segments:
+            counts = segment.term_counts[segment.live]
+            counts.resize((counts.shape[0], total_terms))
+            parts.append(counts)
+        merged = Segment(np.concatenate([segment.doc_ids[segment.live] for segment in segments]),
+                         vstack(parts, format="csr"),
+                         np.concatenate([segment.lengths[segment.live] for segment in segments]))
+        self.segments = [segment for segment in self.segments if all(segment is not old for old in segments)]
+        self._add_segment(merged)
+
+    def idf(self):
+        """
+        IDF of every term over the live restaurants, refreshed lazily after changes.
+        """
+        if self._idf_generation != self.generation:
+            document_frequency = self.document_frequency
+            idf = np.zeros(len(document_frequency))
+            present = document_frequency > 0
+            idf[present] = np.log10(self.total_documents / document_frequency[present])
+            self._idf = idf
+            self._idf_generation = self.generation
+        return self._idf
+
+    def rank(self, term_ids, k=None):
+        """
+        Returns the ids and cosine scores of the restaurants matching the query term IDs, best first.
+        """
+        self.flush()
+        idf = self.idf()
+        counts = Counter(word for word in term_ids if 0 <= word < len(idf))
+        terms = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts)) * idf[terms]
+        norm = np.linalg.norm(weights)
+        if norm == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        weights /= norm
+
+        result_ids, result_scores = [], []
+        for segment in self.segments:
+            in_segment = terms < segment.term_counts.shape[1]
+            if not in_segment.any():
+                continue
+            tf = segment.term_columns[:, terms[in_segment]]
+            scores = tf @ (weights[in_segment] * idf[terms[in_segment]]) / np.maximum(segment.lengths, 1)
+            norms = segment.norms(idf, self.generation)
+            matches = np.flatnonzero((scores > 0) & segment.live & (norms > 0))
+            result_ids.append(segment.doc_ids[matches])
+            result_scores.append(scores[matches] / norms[matches])
+        if not result_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return top_k(np.concatenate(result_ids), np.concatenate(result_scores), k)
+
+    def to_index(self, total_documents=None):
+        """
+        Materializes a TFIDFIndex (rows indexed by restaurant ID) and its vocabulary,
+        e.g. to write it with save_index.
+        """
+        self.flush()
+        self.merge_segments()
+        idf = self.idf()
+        total_terms = len(self.vocabulary)
+        if total_documents is None:
+            total_documents = int(max(self.locations, default=-1)) + 1
+        if not self.segments:
+            index = TFIDFIndex.from_matrix(csr_matrix((total_documents, total_terms)), idf, self.generation)
+            index.bm25 = BM25Scorer.from_term_counts(csr_matrix((total_documents, total_terms)))
+            return index, dict(self.vocabulary)
+
+        segment = self.segments[0]
+        tf = segment.term_counts.tocoo()
+        values = tf.data / np.maximum(segment.lengths[tf.row], 1) * idf[tf.col]
+        doc_matrix = csr_matrix((values, (segment.doc_ids[tf.row], tf.col)), shape=(total_documents, total_terms))
+        index = TFIDFIndex.from_matrix(doc_matrix, idf, self.generation)
+        counts = csr_matrix((tf.data, (segment.doc_ids[tf.row], tf.col)), shape=(total_documents, total_terms))
+        lengths = np.zeros(total_documents)
+        lengths[segment.doc_ids] = segment.lengths
+        index.bm25 = BM25Scorer.from_term_counts(counts, lengths)
+        return index, dict(self.vocabulary)
+
+    def _add_segment(self, segment):
+        self.segments.append(segment)
+        for row, doc_id in enumerate(segment.doc_ids):
+            self.locations[int(doc_id)] = (segment, row)
+
+    def _maybe_merge(self):
+        # Merge the smallest segments first, so every restaurant is copied a logarithmic number of times
+        while len(self.segments) > self.max_segments:
+            smallest = sorted(self.segments, key=lambda segment: segment.live_count)[:2]
+            self.merge_segments(smallest)
+
+    def _changed(self):
+        self.generation = new_generation()
@@ -0,0 +1,532 @@
+import json
+import os
+import sys
+import time
+from collections import Counter
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.preprocessing import normalize
+
+from analyzer import default_analyzer
+from bm25 import BM25Scorer
+from dataset import read_restaurants
+from functions import (description_cleaner,
+                       vocabulary_creator,
+                       reverse_index_creator,
+                       compute_TF,
+                       compute_IDF,
+                       compute_TF_IDF,
+                       top_k)
+from positional import build_positional_index
+
+# Bump whenever the on-disk layout written by save_index changes
+INDEX_FORMAT_VERSION = 3
+
+# Scoring functions a query can be ranked with
+SCORERS = ("tfidf", "bm25")
+INDEX_FORMAT_NAME = "michelin-tfidf"
+
+
+_last_generation = 0
+
+
+# Generation stamp of a newly built index: unique in the process and increasing (nanosecond clock)
+def new_generation():
+    global _last_generation
+    _last_generation = max(time.time_ns(), _last_generation + 1)
+    return _last_generation
+
+
+# Sparse TF-IDF index used by the ranked engines
+class TFIDFIndex:
+    """
+    Holds an L2-normalized document-term matrix (one row per restaurant) and the IDF
+    of every term, so a query is scored against all restaurants with one sparse mat-vec.
+    When the index was built from term counts, bm25 holds a BM25Scorer over the same terms,
+    selected with scorer="bm25" in rank and rank_top_k.
+    """
+
+    def __init__(self, doc_matrix, idf, doc_norms, postings=None, max_impacts=None, generation=None, bm25=None):
+        self.doc_matrix = doc_matrix
+        self.idf = idf
+        self.doc_norms = doc_norms
+        self.bm25 = bm25
+        # Identifies the content of the index, so cached results can be invalidated when it changes;
+        # every index built in memory gets a new one, a loaded index keeps the one of its save
+        self.generation = generation if generation is not None else new_generation()
+        self._postings = postings
+        self._max_impacts = max_impacts
+        self._inverse_norms = None
+
+    @property
+    def postings(self):
+        """
+        Term-major copy of the index: row i holds the restaurants containing term i and their TF-IDF weights.
+        """
+        if self._postings is None:
+            postings = self.doc_matrix.multiply(self.doc_norms[:, None]).T.tocsr()
+            postings.sort_indices()
+            self._postings = postings
+        return self._postings
+
+    @property
+    def max_impacts(self):
+        """
+        Largest normalized weight of each term over all restaurants: an upper bound of what
+        the term can add to a cosine score, per unit of query weight.
+        """
+        if self._max_impacts is None:
+            self._max_impacts = self.doc_matrix.max(axis=0).toarray().ravel()
+        return self._max_impacts
+
+    @property
+    def inverse_norms(self):
+        """
+        1 / doc_norms, with 0 for restaurants whose TF-IDF vector is empty.
+        """
+        if self._inverse_norms is None:
+            self._inverse_norms = np.divide(1.0, self.doc_norms, out=np.zeros(len(self.doc_norms)),
+                                            where=self.doc_norms > 0)
+        return self._inverse_norms
+
+    def documents(self, term_id):
+        """
+        Returns the sorted ids of the restaurants whose description contains the term.
+        """
+        postings = self.postings
+        return postings.indices[postings.indptr[term_id]:postings.indptr[term_id + 1]]
+
+    @property
+    def total_documents(self):
+        return self.doc_matrix.shape[0]
+
+    @property
+    def total_terms(self):
+        return self.doc_matrix.shape[1]
+
+    @classmethod
+    def from_reverse_index(cls, reverse_index_tf_idf, IDF_by_words, total_documents, total_terms=None):
+        """
+        Builds the index from the outputs of compute_TF_IDF and compute_IDF.
+        """
+        if total_terms is None:
+            total_terms = max(IDF_by_words, default=-1) + 1
+
+        rows, cols, values = [], [], []
+        for word_id, doc_id_and_tfidf in reverse_index_tf_idf.items():
+            for doc_id, tf_idf in doc_id_and_tfidf:
+                rows.append(doc_id)
+                cols.append(word_id)
+                values.append(tf_idf)
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+
+        # compute_TF_IDF repeats a posting once per occurrence of the word, keep one per (doc, word)
+        _, first = np.unique(rows * total_terms + cols, return_index=True)
+        doc_matrix = csr_matrix((values[first], (rows[first], cols[first])),
+                                shape=(total_documents, total_terms))
+
+        idf = np.zeros(total_terms)
+        for word_id, idf_value in IDF_by_words.items():
+            idf[word_id] = idf_value
+
+        return cls.from_matrix(doc_matrix, idf)
+
+    @classmethod
+    def from_matrix(cls, doc_matrix, idf, generation=None):
+        """
+        Builds the index from an un-normalized TF-IDF document-term matrix.
+        """
+        doc_matrix = csr_matrix(doc_matrix, dtype=np.float64)
+        doc_matrix.sum_duplicates()
+        doc_norms = np.sqrt(np.asarray(doc_matrix.multiply(doc_matrix).sum(axis=1)).ravel())
+        doc_matrix = normalize(doc_matrix, norm="l2", axis=1, copy=False)
+        return cls(doc_matrix, np.asarray(idf, dtype=np.float64), doc_norms, generation=generation)
+
+    def query_weights(self, term_ids):
+        """
+        Returns the distinct query terms and their L2-normalized TF-IDF weights.
+        """
+        term_ids = [word for word in term_ids if 0 <= word < self.total_terms]
+        counts = Counter(term_ids)
+        terms = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        if len(terms) > 0:
+            weights = weights / len(term_ids) * self.idf[terms]
+        norm = np.linalg.norm(weights)
+        if norm == 0:
+            return terms, weights
+        return terms, weights / norm
+
+    def query_vector(self, term_ids):
+        """
+        Returns the L2-normalized TF-IDF weights of a query as a dense vector over the vocabulary.
+        """
+        vector = np.zeros(self.total_terms)
+        terms, weights = self.query_weights(term_ids)
+        vector[terms] = weights
+        return vector
+
+    def score(self, term_ids):
+        """
+        Computes the cosine similarity between the query and every restaurant.
+        """
+        return self.doc_matrix @ self.query_vector(term_ids)
+
+    def rank(self, term_ids, k=None, candidates=None, scorer="tfidf"):
+        """
+        Returns the ids and cosine scores of the matching restaurants, best first.
+        Only the k best are returned when k is given.
+        When candidates (restaurant IDs, e.g. from a spatial pre-filter) are given, only their rows are scored.
+        scorer="bm25" ranks by BM25 score instead of cosine similarity.
+        """
+        if self.scorer(scorer) is not None:
+            return self.bm25.rank(term_ids, k, candidates)
+        if candidates is None:
+            scores = self.score(term_ids)
+            doc_ids = np.flatnonzero(scores > 0)
+            return top_k(doc_ids, scores[doc_ids], k)
+        candidates = np.asarray(candidates, dtype=np.int64)
+        scores = self.doc_matrix[candidates] @ self.query_vector(term_ids)
+        matching = scores > 0
+        return top_k(candidates[matching], scores[matching], k)
+
+    def scorer(self, name):
+        """
+        Validates a scorer name; returns the BM25Scorer for "bm25" and None for "tfidf".
+        """
+        if name == "tfidf":
+            return None
+        if name not in SCORERS:
+            raise ValueError(f"Unknown scorer {name!r}, expected one of: {', '.join(SCORERS)}")
+        if self.bm25 is None:
+            raise ValueError("This index has no BM25 statistics, rebuild it with build_index")
+        return self.bm25
+
+    def rank_top_k(self, term_ids, k, scorer="tfidf"):
+        """
+        MaxScore top-k retrieval: returns the same k restaurants and scores as rank(term_ids, k)
+        while skipping the restaurants that cannot reach the current k-th best score.
+
+        Query terms are processed by decreasing upper bound (query weight x max impact). Once the
+        upper bounds of the remaining terms add up to less than the k-th best partial score, no
+        unseen restaurant can enter the top-k, so the remaining (usually long, low-impact) postings
+        are only probed for the current candidates with a binary search.
+        scorer="bm25" returns the k best BM25 scores instead (exhaustive term-at-a-time scoring).
+        """
+        if self.scorer(scorer) is not None:
+            return self.bm25.rank(term_ids, k)
+        terms, weights = self.query_weights(term_ids)
+        if k <= 0 or len(terms) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+
+        upper_bounds = weights * self.max_impacts[terms]
+        order = np.argsort(-upper_bounds, kind="stable")
+        terms, weights, upper_bounds = terms[order], weights[order], upper_bounds[order]
+        # remaining[i] is the best score a restaurant can still collect from terms i, i+1, ...
+        remaining = np.append(np.cumsum(upper_bounds[::-1])[::-1], 0.0)
+
+        postings = self.postings
+        inverse_norms = self.inverse_norms
+        candidates = np.zeros(0, dtype=np.int64)
+        candidate_scores = np.zeros(0)
+        threshold = 0.0
+
+        for i, (term, weight) in enumerate(zip(terms, weights)):
+            start, end = postings.indptr[term], postings.indptr[term + 1]
+            docs = postings.indices[start:end]
+
+            if len(candidates) < k or remaining[i] >= threshold:
+                # Unseen restaurants may still enter the top-k: merge the whole postings list
+                impacts = weight * postings.data[start:end] * inverse_norms[docs]
+                position = np.searchsorted(candidates, docs)
+                seen = position < len(candidates)
+                seen[seen] = candidates[position[seen]] == docs[seen]
+                candidate_scores[position[seen]] += impacts[seen]
+                # Both arrays are sorted, so inserting at the searchsorted positions keeps them sorted
+                candidates = np.insert(candidates, position[~seen], docs[~seen])
+                candidate_scores = np.insert(candidate_scores, position[~seen], impacts[~seen])
+            elif len(docs) > 0:
+                # Only the current candidates can still make it: look them up in the postings
+                position = np.minimum(np.searchsorted(docs, candidates), len(docs) - 1)
+                hits = docs[position] == candidates
+                candidate_scores[hits] += (weight * postings.data[start + position[hits]]
+                                           * inverse_norms[candidates[hits]])
+
+            if len(candidates) >= k:
+                threshold = np.partition(candidate_scores, len(candidates) - k)[len(candidates) - k]
+                # Drop the candidates that cannot reach the k-th best score any more
+                alive = candidate_scores + remaining[i + 1] >= threshold
+                candidates, candidate_scores = candidates[alive], candidate_scores[alive]
+
+        positive = candidate_scores > 0
+        return top_k(candidates[positive], candidate_scores[positive], k)
+
+    def query_matrix(self, queries_term_ids):
+        """
+        Stacks the L2-normalized TF-IDF vectors of several queries into a sparse matrix, one row per query.
+        """
+        rows, cols, values = [], [], []
+        for row, term_ids in enumerate(queries_term_ids):
+            term_ids = [word for word in term_ids if 0 <= word < self.total_terms]
+            for word, count in Counter(term_ids).items():
+                rows.append(row)
+                cols.append(word)
+                values.append(count / len(term_ids) * self.idf[word])
+        matrix = csr_matrix((values, (rows, cols)), shape=(len(queries_term_ids), self.total_terms))
+        return normalize(matrix, norm="l2", axis=1, copy=False)
+
+    def score_batch(self, queries_term_ids):
+        """
+        Computes the cosine similarity of every query with every restaurant in one sparse
+        matrix-matrix product. Returns a sparse (queries x restaurants) matrix.
+        """
+        # The postings hold raw weights, so divide by the document norms afterwards
+        scores = (self.query_matrix(queries_term_ids) @ self.postings).tocsr()
+        scores.data *= self.inverse_norms[scores.indices]
+        return scores
+
+    def rank_batch(self, queries_term_ids, k):
+        """
+        Ranks several queries at once. Returns two lists with, for each query, the ids and
+        cosine scores of its k best restaurants as NumPy arrays, best first.
+        """
+        scores = self.score_batch(queries_term_ids)
+        result_ids, result_scores = [], []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            row_scores = scores.data[start:end]
+            positive = row_scores > 0
+            doc_ids, doc_scores = top_k(scores.indices[start:end][positive], row_scores[positive], k)
+            result_ids.append(doc_ids)
+            result_scores.append(doc_scores)
+        return result_ids, result_scores
+
+
+# Read-only word -> ID lookup over the sorted term array of a saved index
+class TermDictionary(Mapping):
+    """
+    Behaves like the vocabulary dict built by vocabulary_creator, but resolves words with a
+    binary search over a sorted (possibly memory-mapped) array instead of holding a Python dict.
+    """
+
+    def __init__(self, terms):
+        self.terms = terms
+
+    def __getitem__(self, word):
+        position = int(np.searchsorted(self.terms, word))
+        if position < len(self.terms) and self.terms[position] == word:
+            return position
+        raise KeyError(word)
+
+    def __contains__(self, word):
+        try:
+            self[word]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return (str(term) for term in self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+
+# Build the index from raw descriptions with the functions.py pipeline
+def build_index(descriptions):
+    """
+    Runs the cleaning, vocabulary, reverse index and TF-IDF builders over the descriptions.
+    Returns the TFIDFIndex and the vocabulary.
+    """
+    descriptions = description_cleaner(descriptions)
+    ID_descriptions, vocabulary = vocabulary_creator(descriptions)
+    reverse_index = reverse_index_creator(ID_descriptions, compressed=True)
+    IDF_by_words = compute_IDF(reverse_index, len(descriptions))
+    reverse_index_tf_idf = compute_TF_IDF(compute_TF(ID_descriptions), IDF_by_words)
+    index = TFIDFIndex.from_reverse_index(reverse_index_tf_idf, IDF_by_words, len(descriptions), len(vocabulary))
+    index.bm25 = BM25Scorer.from_term_counts(term_count_matrix(ID_descriptions, len(descriptions), len(vocabulary)))
+    return index, vocabulary
+
+
+# Count the word IDs of every description into a restaurants x terms matrix
+def term_count_matrix(ID_descriptions, total_documents, total_terms):
+    rows, cols, counts = [], [], []
+    for doc_id, description in ID_descriptions.items():
+        for word, count in Counter(description).items():
+            rows.append(doc_id)
+            cols.append(word)
+            counts.append(count)
+    return csr_matrix((np.asarray(counts, dtype=np.float32), (rows, cols)), shape=(total_documents, total_terms))
+
+
+# Analyze and count the terms of one shard of descriptions (runs in a worker process)
+def _count_shard(descriptions):
+    """
+    Returns the sorted words of the shard and its term-count matrix over them, plus the description lengths.
+    """
+    analyzed = default_analyzer().analyze_many(descriptions)
+    words = sorted({word for description in analyzed for word in description})
+    local_ids = {word: position for position, word in enumerate(words)}
+
+    indptr, indices, counts, lengths = [0], [], [], []
+    for description in analyzed:
+        for word, count in Counter(description).items():
+            indices.append(local_ids[word])
+            counts.append(count)
+        indptr.append(len(indices))
+        lengths.append(len(description))
+    term_counts = csr_matrix((np.asarray(counts, dtype=np.float64), np.asarray(indices, dtype=np.int64), indptr),
+                             shape=(len(analyzed), len(words)))
+    return words, term_counts, np.asarray(lengths, dtype=np.float64)
+
+
+# Build the index on several processes, one shard of descriptions per task
+def build_index_parallel(descriptions, workers=None, shard_size=2000):
+    """
+    Same result as build_index, but the descriptions are analyzed and counted in a process pool,
+    then the per-shard vocabularies and term counts are merged into one index.
+    Returns the TFIDFIndex and the vocabulary.
+    """
+    descriptions = list(descriptions)
+    shards = [descriptions[start:start + shard_size] for start in range(0, len(descriptions), shard_size)]
+    if workers == 1 or len(shards) <= 1:
+        partial_indexes = [_count_shard(shard) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            partial_indexes = list(executor.map(_count_shard, shards))
+
+    # Merge the shard vocabularies into the sorted global one and renumber each shard's columns
+    terms = sorted({word for words, _, _ in partial_indexes for word in words})
+    vocabulary = {word: word_id for word_id, word in enumerate(terms)}
+    parts, lengths = [], []
+    for words, term_counts, shard_lengths in partial_indexes:
+        global_ids = np.asarray([vocabulary[word] for word in words], dtype=np.int64)
+        term_counts = csr_matrix((term_counts.data, global_ids[term_counts.indices], term_counts.indptr),
+                                 shape=(term_counts.shape[0], len(terms)))
+        parts.append(term_counts)
+        lengths.append(shard_lengths)
+    term_counts = vstack(parts, format="csr")
+    lengths = np.concatenate(lengths)
+
+    # TF = count / description length, IDF = log10(N / document frequency)
+    document_frequency = np.bincount(term_counts.indices, minlength=len(terms))
+    idf = np.zeros(len(terms))
+    present = document_frequency > 0
+    idf[present] = np.log10(len(descriptions) / document_frequency[present])
+    tf = term_counts.multiply(1 / np.maximum(lengths, 1)[:, None]).tocsr()
+    index = TFIDFIndex.from_matrix(tf.multiply(idf[None, :]), idf)
+    index.bm25 = BM25Scorer.from_term_counts(term_counts, lengths)
+    return index, vocabulary
+
+
+# Write the index to a directory of .npy files
+def save_index(index, vocabulary, path):
+    """
+    Saves the index so it can be opened with load_index without rebuilding it.
+    Term IDs are renumbered in sorted word order, so the saved IDs are deterministic.
+
+    Layout of the directory:
+    - meta.json: format name, version, sizes and a generation stamp unique to this save (written last).
+    - terms.npy: sorted term dictionary; the position of a term is its ID.
+    - idf.npy: IDF per term.
+    - max_impacts.npy: largest normalized weight of each term, used by rank_top_k.
+    - doc_norms.npy: L2 norm of each restaurant's raw TF-IDF vector.
+    - doc_indptr.npy, doc_terms.npy, doc_weights.npy: normalized document-term matrix (CSR).
+    - postings_indptr.npy, postings_docs.npy, postings_weights.npy: postings with raw TF-IDF weights.
+    - bm25_indptr.npy, bm25_docs.npy, bm25_counts.npy, bm25_idf.npy, doc_lengths.npy: postings with term
+      counts, BM25 IDF and description lengths, when the index has BM25 statistics (meta.json holds
+      their average length, k1 and b).
+    """
+    os.makedirs(path, exist_ok=True)
+
+    terms = sorted(vocabulary, key=str)
+    old_ids = np.asarray([vocabulary[term] for term in terms], dtype=np.int64)
+    doc_matrix = index.doc_matrix[:, old_ids].tocsr()
+    doc_matrix.sort_indices()
+    sorted_index = TFIDFIndex(doc_matrix, index.idf[old_ids], index.doc_norms)
+    postings = sorted_index.postings
+
+    arrays = {
+        "terms": np.asarray(terms, dtype=str),
+        "idf": sorted_index.idf,
+        "max_impacts": sorted_index.max_impacts,
+        "doc_norms": sorted_index.doc_norms,
+        "doc_indptr": doc_matrix.indptr,
+        "doc_terms": doc_matrix.indices,
+        "doc_weights": doc_matrix.data,
+        "postings_indptr": postings.indptr,
+        "postings_docs": postings.indices,
+        "postings_weights": postings.data,
+    }
+    if index.bm25 is not None:
+        bm25_postings = index.bm25.postings[old_ids].tocsr()
+        arrays.update({
+            "bm25_indptr": bm25_postings.indptr,
+            "bm25_docs": bm25_postings.indices,
+            "bm25_counts": bm25_postings.data,
+            "bm25_idf": np.asarray(index.bm25.idf)[old_ids],
+            "doc_lengths": index.bm25.doc_lengths,
+        })
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), array)
+
+    meta = {
+        "format": INDEX_FORMAT_NAME,
+        "version": INDEX_FORMAT_VERSION,
+        "total_documents": sorted_index.total_documents,
+        "total_terms": sorted_index.total_terms,
+        "generation": new_generation(),
+        "bm25": None if index.bm25 is None else {"average_length": float(index.bm25.average_length),
+                                                 "k1": index.bm25.k1, "b": index.bm25.b},
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+# Open an index written by save_index
+def load_index(path, mmap_mode="r"):
+    """
+    Memory-maps a saved index; the arrays are paged in lazily and shared by every process
+    that opens the same directory. Returns the TFIDFIndex and a TermDictionary vocabulary.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("format") != INDEX_FORMAT_NAME or meta.get("version") != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format in {path}: {meta.get('format')} v{meta.get('version')}")
+
+    def array(name):
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+
+    shape = (meta["total_documents"], meta["total_terms"])
+    doc_matrix = csr_matrix((array("doc_weights"), array("doc_terms"), array("doc_indptr")),
+                            shape=shape, copy=False)
+    postings = csr_matrix((array("postings_weights"), array("postings_docs"), array("postings_indptr")),
+                          shape=shape[::-1], copy=False)
+    bm25 = None
+    if meta.get("bm25"):
+        bm25_postings = csr_matrix((array("bm25_counts"), array("bm25_docs"), array("bm25_indptr")),
+                                   shape=shape[::-1], copy=False)
+        bm25 = BM25Scorer(bm25_postings, array("doc_lengths"), array("bm25_idf"), **meta["bm25"])
+    index = TFIDFIndex(doc_matrix, array("idf"), array("doc_norms"), postings, array("max_impacts"),
+                       meta.get("generation") or new_generation(), bm25)
+    return index, TermDictionary(array("terms"))
+
+
+def main():
+    restaurants_file = sys.argv[1] if len(sys.argv) > 1 else "restaurants_i.tsv"
+    index_folder = sys.argv[2] if len(sys.argv) > 2 else "index"
+
+    restaurants_df, _ = read_restaurants(restaurants_file)
+    index, vocabulary = build_index_parallel(list(restaurants_df["description"]))
+    save_index(index, vocabulary, index_folder)
+    build_positional_index(list(restaurants_df["description"]), vocabulary).save(index_folder, vocabulary)
+    print(f"Saved index of {index.total_documents} restaurants and {index.total_terms} terms into {index_folder}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,175 @@
-import os
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-import requests
-
-
-def download_html(url, data_folder, folder_name, file_name):
-    try:
-        full_folder_path = os.path.join(data_folder, folder_name)
-        os.makedirs(full_folder_path, exist_ok=True)
-        file_path = os.path.join(full_folder_path, file_name)
-
-        if os.path.exists(file_path):
-            print(f"File is exists: {file_path}")
-            return
-
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(response.text)
-        print(f"Saved: {file_path}")
-    except Exception as e:
-        print(f"Error with {url}: {e}")
-
-
-def get_urls_file(restaurant_urls_file_name):
-    urls = []
-    with open(restaurant_urls_file_name) as my_file:
-        for line in my_file:
-            urls.append(line.strip())
-    return urls
-
-
-def main():
-    restaurant_urls_file_name = 'restaurant_urls.txt'
-    urls = get_urls_file(restaurant_urls_file_name)
-    print(f"{len(urls)}")
-
-    urls_per_page = 100
-    max_workers = 10
-    start_index = 0
-    data_folder = 'data'
-
-    os.makedirs(data_folder, exist_ok=True)
-
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_url = {}
-
-        for idx, url in enumerate(urls[start_index:], start=start_index):
-            page_number = idx // urls_per_page + 1
-            folder_name = f"page{page_number}"
-            file_name = f"restaurant_{idx + 1}.html"
-            future = executor.submit(download_html, url, data_folder, folder_name, file_name)
-            future_to_url[future] = url
-
-        for future in as_completed(future_to_url):
-            url = future_to_url[future]
-            try:
-                future.result()
-            except Exception as e:
-                print(f"Error with {url}: {e}")
-
-
-if __name__ == "__main__":
-    main()
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+MANIFEST_FILE = "loader_manifest.json"
+# Pages downloaded between two saves of the manifest
+MANIFEST_SAVE_INTERVAL = 100
+
+# HTTP statuses worth retrying: rate limited or temporary server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_thread_local = threading.local()
+
+
+# one keep-alive session per worker thread (requests.Session is not thread safe)
+def get_session():
+    if not hasattr(_thread_local, "session"):
+        _thread_local.session = requests.Session()
+    return _thread_local.session
+
+
+# ETag / Last-Modified of every downloaded page, used for conditional requests
+class Manifest:
+    """
+    One entry per URL with the file its page was written to. A file belongs to a single URL:
+    writing another URL's page into it drops the previous entry, found through owners (path -> URL).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        self.owners = {entry["path"]: url for url, entry in self.entries.items()}
+
+    def get(self, url):
+        with self.lock:
+            return self.entries.get(url)
+
+    def set(self, url, file_path, response):
+        with self.lock:
+            owner = self.owners.get(file_path)
+            if owner is not None and owner != url:
+                self.entries.pop(owner, None)
+            previous = self.entries.get(url)
+            if previous is not None and self.owners.get(previous["path"]) == url:
+                del self.owners[previous["path"]]
+            self.owners[file_path] = url
+            self.entries[url] = {
+                "path": file_path,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+
+    def save(self):
+        with self.lock:
+            temporary_file = self.path + ".tmp"
+            with open(temporary_file, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(temporary_file, self.path)
+
+
+def download_html(url, data_folder, folder_name, file_name, manifest=None, retries=3, backoff=1.0):
+    """
+    Downloads a page into data_folder/folder_name/file_name and returns what happened:
+    "downloaded", "not_modified" (the server answered 304 to a conditional request),
+    "exists" (file already there and no manifest to revalidate it) or "failed".
+    """
+    full_folder_path = os.path.join(data_folder, folder_name)
+    os.makedirs(full_folder_path, exist_ok=True)
+    file_path = os.path.join(full_folder_path, file_name)
+
+    headers = {}
+    entry = manifest.get(url) if manifest is not None else None
+    if os.path.exists(file_path):
+        if manifest is None:
+            print(f"File is exists: {file_path}")
+            return "exists"
+        # Revalidate only when the file holds this URL's page (the URL list may have been reordered)
+        if entry is not None and entry.get("path") != file_path:
+            entry = None
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    for attempt in range(retries + 1):
+        try:
+            response = get_session().get(url, headers=headers, timeout=10)
+            if response.status_code == 304:
+                return "not_modified"
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(response.text)
+                if manifest is not None:
+                    manifest.set(url, file_path, response)
+                print(f"Saved: {file_path}")
+                return "downloaded"
+            error = f"HTTP {response.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        except Exception as e:
+            print(f"Error with {url}: {e}")
+            return "failed"
+        if attempt < retries:
+            # jitter spreads the retries of the worker threads over time
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    print(f"Error with {url}: {error}")
+    return "failed"
+
+
+def get_urls_file(restaurant_urls_file_name):
+    urls = []
+    with open(restaurant_urls_file_name) as my_file:
+        for line in my_file:
+            urls.append(line.strip())
+    return urls
+
+
+def main():
+    restaurant_urls_file_name = 'restaurant_urls.txt'
+    urls = get_urls_file(restaurant_urls_file_name)
+    print(f"{len(urls)}")
+
+    urls_per_page = 100
+    max_workers = 10
+    start_index = 0
+    data_folder = 'data'
+
+    os.makedirs(data_folder, exist_ok=True)
+    manifest = Manifest(MANIFEST_FILE)
+    statuses = Counter()
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_url = {}
+
+        for idx, url in enumerate(urls[start_index:], start=start_index):
+            page_number = idx // urls_per_page + 1
+            folder_name = f"page{page_number}"
+            file_name = f"restaurant_{idx + 1}.html"
+            future = executor.submit(download_html, url, data_folder, folder_name, file_name, manifest)
+            future_to_url[future] = url
+
+        try:
+            for future in as_completed(future_to_url):
+                url = future_to_url[future]
+                try:
+                    statuses[future.result()] += 1
+                except Exception as e:
+                    statuses["failed"] += 1
+                    print(f"Error with {url}: {e}")
+                # Save regularly, so a crash only loses the validators of the last pages
+                if sum(statuses.values()) % MANIFEST_SAVE_INTERVAL == 0:
+                    manifest.save()
+        finally:
+            manifest.save()
+
+    elapsed = time.perf_counter() - start
+    print(f"{sum(statuses.values())} pages in {elapsed:.1f}s ({sum(statuses.values()) / elapsed:.1f} pages/s): "
+          + ", ".join(f"{count} {status}" for status, count in sorted(statuses.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import bisect
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Upper bounds of the latency buckets in milliseconds: 0.01 ms to ~10 s, growing by sqrt(2)
+BUCKET_BOUNDS_MS = [0.01 * 2 ** (i / 2) for i in range(41)]
+
+_disabled_stage = nullcontext()
+
+
+# Bucketed distribution of the durations of one stage
+class Histogram:
+    """
+    Counts durations in BUCKET_BOUNDS_MS buckets (plus one for longer ones) and keeps the exact
+    count, sum, min and max. Percentiles are estimated by the upper bound of their bucket.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = float("inf")
+        self.max_ms = 0.0
+        self.net_allocated_bytes = 0
+
+    def record(self, duration_ms, net_allocated_bytes=0):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS_MS, duration_ms)] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.min_ms = min(self.min_ms, duration_ms)
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.net_allocated_bytes += net_allocated_bytes
+
+    def percentile(self, q):
+        if self.count == 0:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for position, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                bound = BUCKET_BOUNDS_MS[position] if position < len(BUCKET_BOUNDS_MS) else self.max_ms
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total_ms,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "min_ms": self.min_ms if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_ms,
+            "mean_net_allocated_bytes": self.net_allocated_bytes / self.count if self.count else 0.0,
+            "buckets": dict(zip([f"<={bound:g}ms" for bound in BUCKET_BOUNDS_MS] + ["longer"], self.buckets)),
+        }
+
+
+# Per-stage timings of the queries, disabled by default
+class Metrics:
+    """
+    with metrics.stage("score"): ... records the wall time of the block and, only when net bytes are
+    tracked (opt-in), the net number of bytes it left allocated (tracemalloc): this is not an
+    allocation count, bytes allocated and freed within the block are not counted, and the figure is
+    negative when the block freed more. While disabled, stage() returns
+    a shared no-op context manager, so the instrumented code costs one attribute check.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.track_net_bytes = False
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def enable(self, net_bytes=False):
+        """
+        Starts recording; net_bytes=True also records the net bytes of every stage with tracemalloc,
+        which slows down every allocation.
+        """
+        self.enabled = True
+        self.track_net_bytes = net_bytes
+        if net_bytes and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.track_net_bytes and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.track_net_bytes = False
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def stage(self, name):
+        if not self.enabled:
+            return _disabled_stage
+        return self._timed_stage(name)
+
+    @contextmanager
+    def _timed_stage(self, name):
+        track_net_bytes = self.track_net_bytes and tracemalloc.is_tracing()
+        net_allocated = tracemalloc.get_traced_memory()[0] if track_net_bytes else 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            if track_net_bytes:
+                net_allocated = tracemalloc.get_traced_memory()[0] - net_allocated
+            with self.lock:
+                if name not in self.histograms:
+                    self.histograms[name] = Histogram()
+                self.histograms[name].record(duration_ms, net_allocated)
+
+    def snapshot(self):
+        """
+        {stage: summary of its histogram}, in the order the stages were first seen.
+        """
+        with self.lock:
+            return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+
+# Shared by the engines and the search API
+metrics = Metrics()
+
+
+# Run one query under cProfile and tracemalloc
+def profile_query(function, *args, top=20, **kwargs):
+    """
+    Calls function(*args, **kwargs) once and returns {"result", "seconds", "profile", "peak_bytes",
+    "net_bytes_by_line"}: the cProfile report of the `top` slowest functions (cumulative time) and the
+    `top` source lines whose memory changed the most during the call (net bytes and blocks still
+    allocated at the end, negative when freed).
+    """
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    profiler = cProfile.Profile()
+
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        profiler.disable()
+        seconds = time.perf_counter() - start
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        if not was_tracing:
+            tracemalloc.stop()
+
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(top)
+    net_bytes_by_line = [{"line": str(stat.traceback[0]), "net_bytes": stat.size_diff, "net_blocks": stat.count_diff}
+                         for stat in after.compare_to(before, "lineno")[:top]]
+    return {"result": result, "seconds": seconds, "profile": report.getvalue(),
+            "peak_bytes": peak_bytes, "net_bytes_by_line": net_bytes_by_line}
@@ -1,8 +1,20 @@
+import argparse
+import hashlib
+import json
 import os
+import re
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 from bs4 import BeautifulSoup
 
+# Kept outside data/, whose sub-folders are all treated as downloaded pages
+PARSE_CACHE_FILE = "parse_cache.sqlite"
+# Version of the records stored in the parse cache, to bump whenever get_data changes
+PARSE_CACHE_VERSION = 1
+
 
 # function to parsing data from html
 def get_data(html_content):
@@ -58,30 +70,168 @@ def get_data(html_content):
     return restaurant_data
 
 
-def main():
-    columns = [
-        "restaurantName", "address", "city", "postalCode", "country",
-        "priceRange", "cuisineType", "description", "facilitiesServices",
-        "creditCards", "phoneNumber", "website"
-    ]
-    restaurant_data_list = []
-    count = 0
-    data_folder = 'data'
-    # save data to csv
-    for page in os.listdir(data_folder):
+COLUMNS = [
+    "restaurantName", "address", "city", "postalCode", "country",
+    "priceRange", "cuisineType", "description", "facilitiesServices",
+    "creditCards", "phoneNumber", "website"
+]
+
+
+# sort key putting page2 before page10 and restaurant_2 before restaurant_10, i.e. in crawl order
+def natural_key(name):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", name)]
+
+
+# every downloaded page, data/page*/restaurant_*.html
+def iter_html_files(data_folder):
+    for page in sorted(os.listdir(data_folder), key=natural_key):
         page_path = os.path.join(data_folder, page)
-        for link in os.listdir(page_path):
-            full_path = os.path.join(page_path, link)
-            count += 1
-            print(full_path, "Number " + str(count))
-            with open(full_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-
-            restaurant_data = get_data(content)
-            restaurant_data_list.append(restaurant_data)
-
-    restaurants_df = pd.DataFrame(restaurant_data_list, columns=columns)
-    restaurants_df.to_csv("restaurants_i.tsv", index=False, encoding="utf-8", sep="\t")
+        if not os.path.isdir(page_path):
+            continue
+        for link in sorted(os.listdir(page_path), key=natural_key):
+            yield os.path.join(page_path, link)
+
+
+# read and parse one page (runs in a worker process)
+def parse_file(full_path):
+    with open(full_path, 'r', encoding='utf-8') as file:
+        content = file.read()
+    return get_data(content)
+
+
+# hash of the page content, the key of the parse cache
+def file_hash(full_path):
+    with open(full_path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+# records already extracted by get_data, keyed by the hash of their HTML
+class ParseCache:
+    """
+    SQLite table mapping a content hash to the JSON record get_data returned for it.
+    Bumping PARSE_CACHE_VERSION (when get_data changes) empties the cache on the next run.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != PARSE_CACHE_VERSION:
+            self.connection.execute("DROP TABLE IF EXISTS records")
+            self.connection.execute(f"PRAGMA user_version = {PARSE_CACHE_VERSION}")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS records (hash TEXT PRIMARY KEY, record TEXT NOT NULL)")
+
+    def get(self, digest):
+        row = self.connection.execute("SELECT record FROM records WHERE hash = ?", (digest,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, digest, record):
+        self.connection.execute("INSERT OR REPLACE INTO records VALUES (?, ?)", (digest, json.dumps(record)))
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+# records of every page in the order of paths, as (record, from_cache)
+def iter_records(executor, paths, cache, max_in_flight):
+    """
+    Pages found in the cache are ready right away; the others are parsed on the executor, with at
+    most max_in_flight of them submitted at a time, and added to the cache. Records come out in the
+    order of paths (the restaurant IDs), whatever order the workers finish in: a bounded reorder
+    buffer holds the ones that are ready before the records ahead of them.
+    """
+    pending = deque()
+    in_flight = 0
+
+    def next_record():
+        nonlocal in_flight
+        item, digest, from_cache = pending.popleft()
+        if from_cache:
+            return item, True
+        in_flight -= 1
+        record = item.result()
+        if cache is not None:
+            cache.put(digest, record)
+        return record, False
+
+    for full_path in paths:
+        digest = None
+        if cache is not None:
+            digest = file_hash(full_path)
+            record = cache.get(digest)
+            if record is not None:
+                pending.append((record, digest, True))
+        if digest is None or record is None:
+            pending.append((executor.submit(parse_file, full_path), digest, False))
+            in_flight += 1
+        # Hand out the records that are ready, and wait for the oldest one when the buffer is full
+        while pending and (pending[0][2] or pending[0][0].done()
+                           or in_flight >= max_in_flight or len(pending) >= 4 * max_in_flight):
+            yield next_record()
+    while pending:
+        yield next_record()
+
+
+def write_chunk(records, output_file, first_chunk):
+    chunk_df = pd.DataFrame(records, columns=COLUMNS)
+    chunk_df.to_csv(output_file, mode="w" if first_chunk else "a", header=first_chunk,
+                    index=False, encoding="utf-8", sep="\t")
+
+
+# parse every page and append the records to the TSV in chunks
+def parse_pages(data_folder="data", output_file="restaurants_i.tsv", workers=None, chunk_size=500,
+                cache_file=PARSE_CACHE_FILE):
+    """
+    Parses the pages on a pool of worker processes and writes the records as soon as a chunk
+    of them is ready, so memory use does not grow with the number of pages.
+    Pages whose content hash is in cache_file are not parsed again (cache_file=None disables the cache).
+    Records are written in the order of the files (sorted by folder and name). Returns the number of pages and of cache hits.
+    """
+    workers = workers or os.cpu_count()
+    cache = ParseCache(cache_file) if cache_file else None
+    chunk = []
+    count = 0
+    hits = 0
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            records = iter_records(executor, iter_html_files(data_folder), cache, max_in_flight=4 * workers)
+            for restaurant_data, from_cache in records:
+                chunk.append(restaurant_data)
+                hits += from_cache
+                if len(chunk) >= chunk_size:
+                    write_chunk(chunk, output_file, first_chunk=count == 0)
+                    count += len(chunk)
+                    chunk = []
+                    if cache is not None:
+                        cache.commit()
+                    print(f"Parsed {count} pages")
+    finally:
+        if cache is not None:
+            cache.close()
+
+    if chunk or count == 0:
+        write_chunk(chunk, output_file, first_chunk=count == 0)
+        count += len(chunk)
+    print(f"Parsed {count} pages into {output_file}")
+    if cache is not None:
+        print(f"Parse cache: {hits} hits, {count - hits} parsed ({hits / max(count, 1):.1%} hit ratio)")
+    return {"pages": count, "cache_hits": hits}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse the downloaded restaurant pages into a TSV")
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--output", default="restaurants_i.tsv")
+    parser.add_argument("--workers", type=int, default=None, help="parsing processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="records written at a time")
+    parser.add_argument("--cache", default=PARSE_CACHE_FILE, help="parse cache file")
+    parser.add_argument("--no-cache", action="store_true", help="parse every page again")
+    args = parser.parse_args()
+    parse_pages(args.data, args.output, args.workers, args.chunk_size, None if args.no_cache else args.cache)
 
 
 if __name__ == "__main__":
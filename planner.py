@@ -0,0 +1,172 @@
+import numpy as np
+
+from attributes import selection
+from bitmaps import Bitmap, BitmapIndex
+from cache import make_key
+from metrics import metrics
+
+# Relative cost of one restaurant in a bitmap filter (AND of 64-bit words and decoding of the
+# candidates), versus scoring one (restaurant, term) weight of the TF-IDF matrix
+MASK_COST = 0.02
+# Relative cost of filtering one scored match
+FILTER_COST = 0.1
+
+
+# Steps chosen by the planner, with their estimated and actual candidate counts
+class QueryPlan:
+    def __init__(self, strategy, total_documents, costs, scorer="tfidf"):
+        self.strategy = strategy
+        self.total_documents = total_documents
+        self.costs = costs
+        self.scorer = scorer
+        self.steps = []
+
+    def add_step(self, name, detail, estimated, filter_name=None):
+        self.steps.append({"step": name, "filter": filter_name, "detail": detail,
+                           "estimated": int(round(estimated)), "actual": None})
+        return self.steps[-1]
+
+    def explain(self):
+        """
+        Readable description of the plan: the chosen strategy, the estimated cost of both strategies
+        and, for every step, the estimated and actual number of restaurants left after it.
+        """
+        lines = [f"{self.strategy} over {self.total_documents} restaurants with {self.scorer} "
+                 f"(estimated cost: filter_first {self.costs['filter_first']:.0f}, "
+                 f"score_first {self.costs['score_first']:.0f})"]
+        for position, step in enumerate(self.steps, start=1):
+            actual = "not run" if step["actual"] is None else step["actual"]
+            lines.append(f"  {position}. {step['step']} {step['detail']}: estimated {step['estimated']}, actual {actual}")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {"strategy": self.strategy, "total_documents": self.total_documents, "scorer": self.scorer,
+                "costs": dict(self.costs), "steps": [dict(step) for step in self.steps]}
+
+
+# Choose whether the hard filters run before or after the scoring
+class QueryPlanner:
+    """
+    Hard filters (region, credit cards, spatial candidates) either restrict the restaurants that get
+    scored (filter_first) or drop the scored matches afterwards (score_first); both run on the
+    bitmaps of a BitmapIndex. Selectivities come from
+    the postings lengths of the query terms and from attribute counts taken once at construction,
+    assuming the filters are independent.
+    An optional ResultCache keeps the full rankings of score_first plans (shared with engine.rank_query).
+    The costs depend on the scorer, in units of one scored (restaurant, term) weight:
+    - tfidf scores all the restaurants with one product over the whole TF-IDF matrix, and the candidates
+      of filter_first row by row.
+    - bm25 scores all the restaurants from the postings of the query terms only (plus an accumulator
+      over every restaurant), and the candidates with a binary search in every postings list.
+    """
+
+    def __init__(self, index, attributes, cache=None):
+        self.index = index
+        self.attributes = attributes
+        self.cache = cache
+        self.total_documents = index.total_documents
+        self.region_counts = np.bincount(attributes.regions + 1, minlength=len(attributes.region_names) + 1)
+        self.card_counts = np.asarray(attributes.cards.sum(axis=0)).ravel()
+        self.bitmaps = BitmapIndex.from_attributes(attributes)
+        self.postings_lengths = np.diff(index.postings.indptr)
+        self.average_length = index.doc_matrix.nnz / max(self.total_documents, 1)
+        self.bm25_lengths = np.diff(index.bm25.postings.indptr) if index.bm25 is not None else None
+
+    def scoring_costs(self, terms, filtered, scorer):
+        """
+        Estimated cost of scoring every restaurant and of scoring `filtered` candidates.
+        """
+        n = max(self.total_documents, 1)
+        if scorer == "bm25":
+            lengths = self.bm25_lengths[terms].astype(np.float64)
+            # score_candidates searches the shorter of each postings list and the candidates in the other
+            shorter, longer = np.minimum(lengths, filtered), np.maximum(lengths, filtered)
+            return lengths.sum() + n * MASK_COST, float((shorter * np.log2(longer + 1)).sum())
+        return self.index.doc_matrix.nnz, filtered * self.average_length
+
+    def plan(self, term_ids, region=None, credit_cards=None, spatial_candidates=None, scorer="tfidf"):
+        """
+        Returns the QueryPlan of a query, without running it.
+        """
+        self.index.scorer(scorer)
+        n = max(self.total_documents, 1)
+        terms = np.unique([term for term in term_ids if 0 <= term < self.index.total_terms]).astype(np.int64)
+        matches = min(n, int(self.postings_lengths[terms].sum()))
+
+        filters = []
+        if spatial_candidates is not None:
+            filters.append(("spatial", f"{len(spatial_candidates)} restaurants", len(spatial_candidates) / n))
+        if region:
+            code = self.attributes.region_names.index(region) if region in self.attributes.region_names else None
+            count = self.region_counts[code + 1] if code is not None else 0
+            filters.append(("region", repr(region), count / n))
+        cards = selection(self.attributes.card_names, credit_cards)
+        if cards.any():
+            # A restaurant passes when it accepts at least one of the cards
+            miss = np.prod(1 - self.card_counts[cards > 0] / n)
+            filters.append(("credit_cards", repr(list(credit_cards)), 1 - miss))
+
+        selectivity = float(np.prod([fraction for _, _, fraction in filters])) if filters else 1.0
+        filtered = n * selectivity
+        score_all, score_filtered = self.scoring_costs(terms, filtered, scorer)
+        costs = {
+            "filter_first": n * MASK_COST * len(filters) + score_filtered,
+            "score_first": score_all + matches * FILTER_COST * len(filters),
+        }
+        strategy = "filter_first" if filters and costs["filter_first"] < costs["score_first"] else "score_first"
+        plan = QueryPlan(strategy, self.total_documents, costs, scorer)
+
+        remaining = n
+        if strategy == "score_first":
+            plan.add_step("score", f"{len(terms)} terms", matches)
+            remaining = matches
+        # The most selective filter first, so the next ones test fewer restaurants
+        for name, detail, fraction in sorted(filters, key=lambda item: item[2]):
+            remaining *= fraction
+            plan.add_step("filter", f"{name}={detail}", remaining, name)
+        if strategy == "filter_first":
+            plan.add_step("score", f"{len(terms)} terms", min(remaining, matches))
+        return plan
+
+    def execute(self, term_ids, region=None, credit_cards=None, spatial_candidates=None, scorer="tfidf"):
+        """
+        Plans and runs the query. Returns the matching restaurant IDs, their scores (best first)
+        and the QueryPlan with the actual candidate counts filled in.
+        """
+        self.index.scorer(scorer)
+        plan = self.plan(term_ids, region, credit_cards, spatial_candidates, scorer)
+
+        def bitmap(step):
+            if step["filter"] == "spatial":
+                return Bitmap.from_ids(spatial_candidates, self.total_documents)
+            if step["filter"] == "region":
+                return self.bitmaps.match(region=region)
+            return self.bitmaps.match(credit_cards=credit_cards)
+
+        candidates = doc_ids = scores = None
+        for step in plan.steps:
+            if step["step"] == "score":
+                with metrics.stage("score"):
+                    doc_ids, scores = self.rank(term_ids, None if candidates is None else candidates.to_ids(), scorer)
+                step["actual"] = len(doc_ids)
+            elif doc_ids is not None:
+                with metrics.stage("filter"):
+                    kept = bitmap(step).contains(doc_ids)
+                    doc_ids, scores = doc_ids[kept], scores[kept]
+                step["actual"] = len(doc_ids)
+            else:
+                with metrics.stage("filter"):
+                    candidates = bitmap(step) if candidates is None else candidates & bitmap(step)
+                step["actual"] = candidates.count()
+        return doc_ids, scores, plan
+
+    def rank(self, term_ids, candidates=None, scorer="tfidf"):
+        if candidates is not None or self.cache is None:
+            return self.index.rank(term_ids, candidates=candidates, scorer=scorer)
+        key = make_key(term_ids, k=None, scorer=scorer)
+        cached = self.cache.get(key, self.index.generation)
+        if cached is None:
+            doc_ids, scores = self.index.rank(term_ids, scorer=scorer)
+            self.cache.put(key, (tuple(doc_ids.tolist()), tuple(scores.tolist())), self.index.generation)
+            return doc_ids, scores
+        return np.asarray(cached[0], dtype=np.int64), np.asarray(cached[1])
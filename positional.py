@@ -0,0 +1,258 @@
+import json
+import os
+import re
+from functools import reduce
+
+import numpy as np
+
+from analyzer import default_analyzer
+from postings import encode_varints, decode_varints, intersect_postings
+
+POSITIONS_FORMAT_VERSION = 1
+# Largest score added to a restaurant whose query terms are next to each other
+PROXIMITY_BOOST = 0.2
+# "words"~N in a query: the words within a window of N analyzed terms, in any order
+PHRASE_PATTERN = re.compile(r'"([^"]*)"(?:~(\d+))?')
+
+
+# Split the quoted phrases and proximity groups out of a query
+def parse_phrases(query):
+    """
+    Returns the rest of the query and a list of (phrase text, window) where window is None for an
+    exact phrase ("wood fired oven") and N for a proximity group ("wood oven"~5).
+    """
+    phrases = [(match.group(1), int(match.group(2)) if match.group(2) else None)
+               for match in PHRASE_PATTERN.finditer(query)]
+    return PHRASE_PATTERN.sub(" ", query), phrases
+
+
+# Term positions of every restaurant, grouped by term
+class PositionalIndex:
+    """
+    For every term, the sorted restaurants containing it (docs[term_indptr[t]:term_indptr[t + 1]]) and,
+    for every such (term, restaurant) pair, its positions in the analyzed description stored as
+    delta + varint bytes (positions[position_offsets[p]:position_offsets[p + 1]]).
+    Positions are only decoded for the restaurants passed in, i.e. the ones that survived the
+    doc-level intersection, so plain queries never touch them.
+    """
+
+    def __init__(self, term_indptr, docs, position_offsets, positions):
+        self.term_indptr = term_indptr
+        self.docs = docs
+        self.position_offsets = position_offsets
+        self.positions = positions
+
+    @classmethod
+    def from_descriptions(cls, ID_descriptions, total_terms=None):
+        """
+        Builds the index from the word IDs of every description, in text order (vocabulary_creator).
+        Negative word IDs (unknown words) are not indexed but still take their position.
+        """
+        doc_ids, term_ids, positions = [], [], []
+        for doc_id, word_ids in ID_descriptions.items():
+            doc_ids.append(np.full(len(word_ids), doc_id, dtype=np.int64))
+            term_ids.append(np.asarray(word_ids, dtype=np.int64))
+            positions.append(np.arange(len(word_ids), dtype=np.int64))
+        doc_ids, term_ids, positions = (np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.int64)
+                                        for arrays in (doc_ids, term_ids, positions))
+        known = term_ids >= 0
+        doc_ids, term_ids, positions = doc_ids[known], term_ids[known], positions[known]
+        if total_terms is None:
+            total_terms = int(term_ids.max()) + 1 if len(term_ids) else 0
+
+        # Term-major, then restaurant, then position order
+        order = np.lexsort((positions, doc_ids, term_ids))
+        doc_ids, term_ids, positions = doc_ids[order], term_ids[order], positions[order]
+        new_pair = np.ones(len(order), dtype=bool)
+        new_pair[1:] = (term_ids[1:] != term_ids[:-1]) | (doc_ids[1:] != doc_ids[:-1])
+        pair_starts = np.flatnonzero(new_pair)
+
+        # The first position of a pair is stored as is, the next ones as gaps
+        gaps = positions.copy()
+        gaps[1:] -= positions[:-1]
+        gaps[new_pair] = positions[new_pair]
+        encoded, lengths = encode_varints(gaps)
+        value_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        position_offsets = value_offsets[np.append(pair_starts, len(order))]
+
+        term_indptr = np.zeros(total_terms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids[pair_starts], minlength=total_terms), out=term_indptr[1:])
+        return cls(term_indptr, doc_ids[pair_starts].astype(np.uint32), position_offsets, encoded)
+
+    @property
+    def total_terms(self):
+        return len(self.term_indptr) - 1
+
+    def size_in_bytes(self):
+        return self.term_indptr.nbytes + self.docs.nbytes + self.position_offsets.nbytes + self.positions.nbytes
+
+    def postings(self, term):
+        """
+        Sorted IDs of the restaurants containing the term.
+        """
+        if not 0 <= term < self.total_terms:
+            return self.docs[:0]
+        return self.docs[self.term_indptr[term]:self.term_indptr[term + 1]]
+
+    def occurrences(self, term, doc_ids):
+        """
+        Occurrences of a term in the sorted doc_ids, as sorted int64 keys (restaurant << 32) | position.
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        docs = self.postings(term)
+        found = np.searchsorted(docs, doc_ids)
+        present = found < len(docs)
+        present[present] = docs[found[present]] == doc_ids[present]
+        pairs = self.term_indptr[term] + found[present]
+        if len(pairs) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        # Gather the bytes of the selected pairs and decode them in one pass
+        starts, ends = self.position_offsets[pairs], self.position_offsets[pairs + 1]
+        lengths = ends - starts
+        byte_index = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        encoded = np.asarray(self.positions[byte_index])
+        gaps = decode_varints(encoded).astype(np.int64)
+
+        # Every varint ends with a byte below 0x80: count the positions of each pair to undo the deltas
+        counts = np.add.reduceat(encoded < 0x80, np.cumsum(lengths) - lengths).astype(np.int64)
+        totals = np.cumsum(gaps)
+        first = np.cumsum(counts) - counts
+        positions = totals - np.repeat(totals[first] - gaps[first], counts)
+        return (np.repeat(doc_ids[present], counts) << 32) | positions
+
+    def phrase_match(self, term_ids, doc_ids):
+        """
+        The doc_ids (sorted, already containing every term) where the terms appear next to each other,
+        in the query order.
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if len(term_ids) < 2 or len(doc_ids) == 0:
+            return doc_ids
+        # Shift the positions of the i-th term back by i: a phrase starts at a key shared by all terms
+        starts = []
+        for offset, term in enumerate(term_ids):
+            keys = self.occurrences(term, doc_ids)
+            starts.append(keys[(keys & 0xFFFFFFFF) >= offset] - offset)
+        starts = reduce(lambda left, right: np.intersect1d(left, right, assume_unique=True), starts)
+        return np.unique(starts >> 32)
+
+    def min_spans(self, term_ids, doc_ids):
+        """
+        Width (last position - first position) of the smallest window holding every term, for each
+        of the sorted doc_ids that contain every term.
+        """
+        terms = list(dict.fromkeys(term_ids))
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if len(doc_ids) == 0:
+            return np.zeros(0, dtype=np.int64)
+        keys = [self.occurrences(term, doc_ids) for term in terms]
+
+        # The smallest window starts at an occurrence: reach from there the next occurrence of every term
+        anchors = np.sort(np.concatenate(keys))
+        spans = np.zeros(len(anchors), dtype=np.int64)
+        for term_keys in keys:
+            following = np.searchsorted(term_keys, anchors)
+            reached = following < len(term_keys)
+            distance = np.full(len(anchors), np.iinfo(np.int64).max)
+            same_doc = reached.copy()
+            same_doc[reached] = (term_keys[following[reached]] >> 32) == (anchors[reached] >> 32)
+            distance[same_doc] = term_keys[following[same_doc]] - anchors[same_doc]
+            spans = np.maximum(spans, distance)
+
+        doc_starts = np.flatnonzero(np.diff(anchors >> 32, prepend=-1))
+        return np.minimum.reduceat(spans, doc_starts)
+
+    def near_match(self, term_ids, doc_ids, window):
+        """
+        The doc_ids (sorted, already containing every term) where all the terms fit in `window`
+        consecutive positions, in any order.
+        """
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if len(set(term_ids)) < 2 or len(doc_ids) == 0:
+            return doc_ids
+        return doc_ids[self.min_spans(term_ids, doc_ids) < window]
+
+    def boost(self, doc_ids, scores, term_ids, weight=PROXIMITY_BOOST):
+        """
+        Adds weight * (terms - 1) / span to the scores of the doc_ids containing every query term, where
+        span is the width of their smallest window of query terms: adjacent terms get the whole weight.
+        """
+        scores = np.array(scores, dtype=np.float64)
+        terms = list(dict.fromkeys(term_ids))
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        if len(terms) < 2 or len(doc_ids) == 0:
+            return scores
+        order = np.argsort(doc_ids, kind="stable")
+        sorted_ids = doc_ids[order]
+        matching = intersect_postings([self.postings(term) for term in terms] + [sorted_ids]).astype(np.int64)
+        if len(matching) == 0:
+            return scores
+        spans = self.min_spans(terms, matching)
+        scores[order[np.searchsorted(sorted_ids, matching)]] += weight * (len(terms) - 1) / spans
+        return scores
+
+    def save(self, path, vocabulary):
+        """
+        Writes positions_*.npy into an index folder written by save_index, with the term IDs renumbered
+        in sorted word order like the saved index.
+        """
+        terms = sorted(vocabulary, key=str)
+        old_ids = np.asarray([vocabulary[term] for term in terms], dtype=np.int64)
+        if not np.array_equal(old_ids, np.arange(len(old_ids))):
+            self = self.renumbered(old_ids)
+        arrays = {
+            "positions_term_indptr": self.term_indptr,
+            "positions_docs": self.docs,
+            "positions_offsets": self.position_offsets,
+            "positions_data": self.positions,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(path, name + ".npy"), array)
+        with open(os.path.join(path, "positions.json"), "w") as f:
+            json.dump({"version": POSITIONS_FORMAT_VERSION, "total_terms": self.total_terms}, f)
+
+    def renumbered(self, old_ids):
+        """
+        Copy of the index where term i is the term old_ids[i] of this one.
+        """
+        pair_counts = np.diff(self.term_indptr)[old_ids]
+        pair_starts = self.term_indptr[old_ids]
+        pairs = np.repeat(pair_starts - np.cumsum(pair_counts) + pair_counts, pair_counts) + np.arange(pair_counts.sum())
+        byte_counts = self.position_offsets[pairs + 1] - self.position_offsets[pairs]
+        byte_index = (np.repeat(self.position_offsets[pairs] - np.cumsum(byte_counts) + byte_counts, byte_counts)
+                      + np.arange(byte_counts.sum()))
+        term_indptr = np.concatenate(([0], np.cumsum(pair_counts)))
+        position_offsets = np.concatenate(([0], np.cumsum(byte_counts)))
+        return PositionalIndex(term_indptr, self.docs[pairs], position_offsets, self.positions[byte_index])
+
+
+# Build the positional index of raw descriptions over an existing vocabulary
+def build_positional_index(descriptions, vocabulary):
+    """
+    Analyzes the descriptions like the index builders; words missing from the vocabulary are skipped
+    but still take their position.
+    """
+    ID_descriptions = {doc_id: [vocabulary[word] if word in vocabulary else -1 for word in words]
+                       for doc_id, words in enumerate(default_analyzer().analyze_many(descriptions))}
+    return PositionalIndex.from_descriptions(ID_descriptions, len(vocabulary))
+
+
+# Open the positions saved next to an index, if any
+def load_positional_index(path, mmap_mode="r"):
+    """
+    Returns None when the index folder has no positions.json.
+    """
+    meta_file = os.path.join(path, "positions.json")
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if meta.get("version") != POSITIONS_FORMAT_VERSION:
+        raise ValueError(f"Unsupported positions format in {path}: v{meta.get('version')}")
+
+    def array(name):
+        return np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+
+    return PositionalIndex(array("positions_term_indptr"), array("positions_docs"), array("positions_offsets"),
+                           array("positions_data"))
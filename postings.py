@@ -0,0 +1,132 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+# Above this length ratio, probing the longer list with binary search beats a linear merge
+SKIP_SEARCH_RATIO = 8
+
+
+# Varint encoding of unsigned integers
+def encode_varints(values):
+    """
+    Stores each value in 7-bit groups (least significant first), the high bit marking a continuation.
+    Returns the encoded bytes as a uint8 array and the number of bytes of each value.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+
+    # Number of 7-bit groups needed by each value (at least one, for a value of 0)
+    lengths = np.ones(len(values), dtype=np.int64)
+    remaining = values >> np.uint64(7)
+    while remaining.any():
+        lengths += remaining > 0
+        remaining >>= np.uint64(7)
+
+    # Byte j of a value holds bits 7j..7j+6
+    owner = np.repeat(np.arange(len(values)), lengths)
+    group = np.arange(len(owner)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    encoded = (values[owner] >> (np.uint64(7) * group.astype(np.uint64))) & np.uint64(0x7F)
+    continuation = group < lengths[owner] - 1
+    encoded[continuation] |= np.uint64(0x80)
+    return encoded.astype(np.uint8), lengths
+
+
+# Inverse of encode_varints
+def decode_varints(encoded):
+    """
+    Decodes a uint8 array of varints into a uint64 array of values.
+    """
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    if len(encoded) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    last = (encoded & 0x80) == 0
+    ends = np.flatnonzero(last)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1)
+    values = (encoded & 0x7F).astype(np.uint64) << (np.uint64(7) * group.astype(np.uint64))
+    return np.add.reduceat(values, starts)
+
+
+# Delta + varint encoding of a sorted postings list
+def compress_postings(doc_ids):
+    """
+    Encodes sorted, distinct document IDs as the gaps between them, each gap stored as a varint.
+    """
+    doc_ids = np.asarray(doc_ids, dtype=np.uint64)
+    if len(doc_ids) == 0:
+        return b""
+    return encode_varints(np.diff(doc_ids, prepend=np.uint64(0)))[0].tobytes()
+
+
+# Inverse of compress_postings
+def decompress_postings(data):
+    """
+    Decodes a delta + varint postings list back into a sorted uint32 array of document IDs.
+    """
+    return np.cumsum(decode_varints(np.frombuffer(data, dtype=np.uint8))).astype(np.uint32)
+
+
+# Reverse index whose postings are kept compressed in memory
+class CompressedReverseIndex(Mapping):
+    """
+    Drop-in replacement for the dict built by reverse_index_creator: postings are stored
+    delta + varint encoded and decoded to uint32 arrays when a word is looked up.
+    """
+
+    def __init__(self, reverse_index):
+        self.encoded = {word_id: compress_postings(doc_ids) for word_id, doc_ids in reverse_index.items()}
+        self.lengths = {word_id: len(doc_ids) for word_id, doc_ids in reverse_index.items()}
+
+    def __getitem__(self, word_id):
+        return decompress_postings(self.encoded[word_id])
+
+    def __iter__(self):
+        return iter(self.encoded)
+
+    def __len__(self):
+        return len(self.encoded)
+
+    def document_frequency(self, word_id):
+        """
+        Length of a postings list, without decoding it.
+        """
+        return self.lengths[word_id]
+
+    def size_in_bytes(self):
+        """
+        Total size of the encoded postings.
+        """
+        return sum(len(data) for data in self.encoded.values())
+
+
+# Intersect two sorted postings lists
+def intersect_two(shorter, longer):
+    """
+    Returns the documents present in both sorted lists. When the longer list is much
+    longer, each document of the shorter one is located in it by binary search, so the
+    cost grows with log(len(longer)) instead of len(longer).
+    """
+    if len(shorter) == 0 or len(longer) == 0:
+        return shorter[:0]
+    if len(longer) < SKIP_SEARCH_RATIO * len(shorter):
+        return np.intersect1d(shorter, longer, assume_unique=True)
+    position = np.searchsorted(longer, shorter)
+    found = position < len(longer)
+    found[found] = longer[position[found]] == shorter[found]
+    return shorter[found]
+
+
+# Conjunctive (AND) intersection of several postings lists
+def intersect_postings(postings_lists):
+    """
+    Intersects sorted postings lists starting from the shortest one, so the candidate
+    set only shrinks and stops early as soon as it becomes empty.
+    """
+    postings_lists = sorted((np.asarray(doc_ids) for doc_ids in postings_lists), key=len)
+    if not postings_lists:
+        return np.zeros(0, dtype=np.uint32)
+    matches = postings_lists[0]
+    for doc_ids in postings_lists[1:]:
+        if len(matches) == 0:
+            break
+        matches = intersect_two(matches, doc_ids)
+    return matches
@@ -0,0 +1,262 @@
+import math
+
+import numpy as np
+
+from analyzer import default_analyzer
+from attributes import AttributeStore
+from cache import ResultCache, make_key
+from dataset import RestaurantDataset, read_restaurants
+from functions import top_k
+from index import load_index
+from metrics import metrics
+from planner import QueryPlanner
+from positional import load_positional_index
+from spatial import SpatialIndex
+from suggest import Suggester
+
+# Restaurant fields returned with every result
+RESULT_COLUMNS = ["restaurantName", "address", "city", "priceRange", "cuisineType", "description", "website"]
+
+# Keys accepted in the filters of a search
+FILTER_KEYS = {"facilities", "cuisine", "min_price", "max_price", "region", "credit_cards",
+               "latitude", "longitude", "radius_km", "bbox"}
+
+
+# Search engine without any UI: query, filters and k in, structured results out
+class SearchEngine:
+    """
+    Read-only search state (restaurants, vocabulary, TF-IDF index, attributes) shared by every request.
+    The restaurants are a DataFrame or a RestaurantDataset, whose rows are only decoded for the results.
+
+    Filters (all optional):
+    - region: only restaurants in this region.
+    - latitude, longitude, radius_km: only restaurants within radius_km of the point.
+    - bbox: only restaurants inside the viewport "south,west,north,east" (degrees).
+    - credit_cards: only restaurants accepting at least one of these cards.
+    - facilities, cuisine: +0.2 to the score for every chosen one the restaurant offers.
+    - min_price, max_price: +0.2 to the score when the number of € is within the bounds (1 to 4).
+    The geographic filters are applied before scoring: only the restaurants they keep are scored.
+    Restaurants are scored by TF-IDF cosine similarity, or by BM25 with scorer="bm25".
+    With a PositionalIndex, restaurants whose description has the query words close together get up to
+    +0.2 (the whole boost when the words are next to each other).
+    """
+
+    def __init__(self, restaurants_df, vocabulary, index, attributes=None, cache=None, spatial=None, positional=None):
+        if isinstance(restaurants_df, RestaurantDataset):
+            self.restaurants_df = restaurants_df
+        else:
+            self.restaurants_df = restaurants_df.reset_index(drop=True)
+        self.vocabulary = vocabulary
+        self.index = index
+        self.attributes = attributes if attributes is not None else AttributeStore.from_dataframe(self.restaurants_df)
+        self.cache = cache
+        if spatial is None and {"latitude", "longitude"} <= set(self.restaurants_df.columns):
+            spatial = SpatialIndex.from_dataframe(self.restaurants_df)
+        self.spatial = spatial
+        self.positional = positional
+        self.planner = QueryPlanner(index, self.attributes)
+        self._suggester = None
+
+    @classmethod
+    def from_files(cls, index_folder, restaurants_file, cache=None):
+        """
+        Opens an index written by save_index and the restaurants it was built from
+        (the TSV or a folder written by dataset.py), with the word positions when they were saved.
+        """
+        index, vocabulary = load_index(index_folder)
+        restaurants_df, attributes = read_restaurants(restaurants_file)
+        return cls(restaurants_df, vocabulary, index, attributes, cache,
+                   positional=load_positional_index(index_folder))
+
+    def search(self, query, filters=None, k=10, scorer="tfidf"):
+        """
+        Returns {"query", "total_matches", "results"} where results lists the k best restaurants
+        as dicts with their id, score and RESULT_COLUMNS.
+        """
+        self.index.scorer(scorer)
+        with metrics.stage("search"):
+            return self._cached_search(query, normalize_filters(filters), k, scorer)
+
+    def _cached_search(self, query, filters, k, scorer):
+        if self.cache is None:
+            return self._search(query, filters, k, scorer)
+
+        # Same analyzed query, filters, k and scorer on the same index: reuse the rendered results
+        key = make_key(self.term_ids(query), filters, k, scorer)
+        response = self.cache.get(key, self.index.generation)
+        if response is None:
+            response = self._search(query, filters, k, scorer)
+            self.cache.put(key, response, self.index.generation)
+        return dict(response, query=query)
+
+    def _search(self, query, filters, k, scorer):
+        doc_ids, scores, _ = self.retrieve(query, filters, scorer)
+
+        if self.positional is not None and len(doc_ids):
+            with metrics.stage("proximity"):
+                scores = self.positional.boost(doc_ids, scores, self.term_ids(query))
+
+        if filters["facilities"] or filters["cuisine"] or filters["price_boost"]:
+            min_price, max_price = filters["min_price"], filters["max_price"]
+            if not filters["price_boost"]:
+                # An empty price range never matches, so only cuisines and facilities add to the score
+                min_price, max_price = 1, 0
+            with metrics.stage("boost"):
+                scores = self.attributes.boost(doc_ids, scores, filters["facilities"], filters["cuisine"],
+                                               min_price, max_price)
+
+        with metrics.stage("top_k"):
+            best_ids, best_scores = top_k(doc_ids, scores, k)
+        with metrics.stage("render"):
+            return {
+                "query": query,
+                "total_matches": len(doc_ids),
+                "results": [self.restaurant(doc_id, score) for doc_id, score in zip(best_ids, best_scores)],
+            }
+
+    @property
+    def suggester(self):
+        """
+        Type-ahead over the vocabulary and the restaurant names, built on first use.
+        """
+        if self._suggester is None:
+            self._suggester = Suggester.from_index(self.index, self.vocabulary, self.restaurants_df["restaurantName"])
+        return self._suggester
+
+    def suggest(self, text, k=10):
+        """
+        Returns {"query", "terms", "restaurants"}: completions of the text being typed (see Suggester.suggest).
+        """
+        with metrics.stage("suggest"):
+            return dict(self.suggester.suggest(text, k), query=text)
+
+    def term_ids(self, query):
+        with metrics.stage("analyze"):
+            return [self.vocabulary[word] for word in default_analyzer().analyze(query) if word in self.vocabulary]
+
+    def retrieve(self, query, filters, scorer="tfidf"):
+        """
+        Matching restaurant IDs and scores after the hard filters (region, credit cards, area),
+        with the QueryPlan that produced them (None when no query word is known).
+        """
+        term_ids = self.term_ids(query)
+        if len(term_ids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), None
+        with metrics.stage("spatial"):
+            candidates = self.spatial_candidates(filters)
+        with metrics.stage("retrieve"):
+            return self.planner.execute(term_ids, filters["region"], filters["credit_cards"], candidates, scorer)
+
+    def explain(self, query, filters=None, scorer="tfidf"):
+        """
+        Runs the retrieval of a search and describes the plan chosen for its hard filters,
+        with the estimated and actual number of restaurants after every step.
+        """
+        _, _, plan = self.retrieve(query, normalize_filters(filters), scorer)
+        if plan is None:
+            return "No query word is in the vocabulary"
+        return plan.explain()
+
+    def spatial_candidates(self, filters):
+        """
+        Sorted IDs of the restaurants kept by the geographic filters, or None when there are none.
+        """
+        if filters["near"] is None and filters["bbox"] is None:
+            return None
+        if self.spatial is None:
+            raise ValueError("The restaurants have no coordinates, run geocode_restaurants.py first")
+        candidates = None
+        if filters["near"] is not None:
+            candidates = self.spatial.within_radius(*filters["near"])
+        if filters["bbox"] is not None:
+            inside = self.spatial.within_bbox(*filters["bbox"])
+            candidates = inside if candidates is None else np.intersect1d(candidates, inside, assume_unique=True)
+        return candidates
+
+    def restaurant(self, doc_id, score):
+        """
+        JSON-ready description of one result.
+        """
+        if isinstance(self.restaurants_df, RestaurantDataset):
+            row = self.restaurants_df.row(int(doc_id), RESULT_COLUMNS)
+        else:
+            row = self.restaurants_df.iloc[int(doc_id)]
+        result = {"id": int(doc_id), "score": float(score)}
+        for column in RESULT_COLUMNS:
+            value = row[column] if column in row else None
+            if isinstance(value, float) and math.isnan(value):
+                value = None
+            result[column] = value
+        return result
+
+
+# Validate the filters of a request and fill in the defaults
+def normalize_filters(filters):
+    """
+    Raises ValueError on unknown keys or bad values.
+    """
+    filters = dict(filters or {})
+    unknown = set(filters) - FILTER_KEYS
+    if unknown:
+        raise ValueError(f"Unknown filters: {', '.join(sorted(unknown))}")
+
+    def as_list(value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [item for item in (part.strip() for part in value.split(",")) if item]
+        return [str(item) for item in value]
+
+    normalized = {
+        "region": filters.get("region") or None,
+        "credit_cards": as_list(filters.get("credit_cards")),
+        "facilities": as_list(filters.get("facilities")),
+        "cuisine": as_list(filters.get("cuisine")),
+        "price_boost": filters.get("min_price") is not None or filters.get("max_price") is not None,
+    }
+    try:
+        normalized["min_price"] = int(filters.get("min_price") or 1)
+        normalized["max_price"] = int(filters.get("max_price") or 4)
+    except (TypeError, ValueError):
+        raise ValueError("min_price and max_price must be integers between 1 and 4")
+
+    near = [filters.get(key) for key in ("latitude", "longitude", "radius_km")]
+    normalized["near"] = None
+    if any(value is not None for value in near):
+        try:
+            normalized["near"] = tuple(float(value) for value in near)
+        except (TypeError, ValueError):
+            raise ValueError("latitude, longitude and radius_km must be given together as numbers")
+
+    bbox = filters.get("bbox")
+    normalized["bbox"] = None
+    if bbox is not None:
+        try:
+            normalized["bbox"] = tuple(float(value) for value in (bbox.split(",") if isinstance(bbox, str) else bbox))
+        except (TypeError, ValueError):
+            raise ValueError("bbox must be four numbers: south, west, north, east")
+        if len(normalized["bbox"]) != 4:
+            raise ValueError("bbox must be four numbers: south, west, north, east")
+    return normalized
+
+
+_worker_engine = None
+
+
+# Process pool initializer: every worker memory-maps the same index files
+def init_worker(index_folder, restaurants_file, cache_size=1024, cache_ttl=300.0):
+    global _worker_engine
+    cache = ResultCache(cache_size, cache_ttl) if cache_size else None
+    _worker_engine = SearchEngine.from_files(index_folder, restaurants_file, cache)
+    # Build the type-ahead now rather than on the first request
+    _worker_engine.suggester
+
+
+# Run a search in a worker process set up by init_worker
+def search_in_worker(query, filters=None, k=10, scorer="tfidf"):
+    return _worker_engine.search(query, filters, k, scorer)
+
+
+# Complete a prefix in a worker process set up by init_worker
+def suggest_in_worker(text, k=10):
+    return _worker_engine.suggest(text, k)
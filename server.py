@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from index import SCORERS
+from search import init_worker, search_in_worker, suggest_in_worker
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 64 * 1024
+
+
+# Error answered to the client with an HTTP status and a JSON message
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# Asyncio HTTP/JSON front end of the search engine
+class SearchServer:
+    """
+    Serves GET /search?q=...&k=...&scorer=...&<filter>=... and POST /search {"query", "k", "scorer", "filters"},
+    GET /suggest?q=...&k=... (type-ahead) and GET /health; scorer is "tfidf" (default) or "bm25".
+    Requests are parsed on the event loop, while the CPU-bound scoring runs in the executor
+    through search_function(query, filters, k, scorer); a search taking longer than timeout seconds
+    is answered with 504.
+    """
+
+    def __init__(self, executor, search_function=search_in_worker, timeout=2.0, max_k=100,
+                 suggest_function=suggest_in_worker):
+        self.executor = executor
+        self.search_function = search_function
+        self.suggest_function = suggest_function
+        self.timeout = timeout
+        self.max_k = max_k
+
+    async def start(self, host="127.0.0.1", port=8000):
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            status, payload = await self.handle_request(reader)
+        except RequestError as error:
+            status, payload = error.status, {"error": error.message}
+        except Exception as error:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(error)}
+
+        body = json.dumps(payload).encode("utf-8")
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n")
+        try:
+            writer.write(head.encode("ascii") + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.timeout)
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+        except asyncio.TimeoutError:
+            raise RequestError(HTTPStatus.REQUEST_TIMEOUT, "Timed out reading the request")
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+
+        url = urlsplit(target)
+        if url.path == "/health":
+            return HTTPStatus.OK, {"status": "ok"}
+        if url.path == "/suggest":
+            if method != "GET":
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, f"Method {method} not allowed")
+            return await self.run(self.suggest_function, *self.parse_suggest(url.query))
+        if url.path != "/search":
+            raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown path {url.path}")
+
+        if method == "GET":
+            query, filters, k, scorer = self.parse_query_string(url.query)
+        elif method == "POST":
+            query, filters, k, scorer = self.parse_body(await self.read_body(reader, headers))
+        else:
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, f"Method {method} not allowed")
+
+        return await self.run(self.search_function, query, filters, k, scorer)
+
+    async def run(self, function, *args):
+        # The work runs in the executor, so the event loop keeps accepting requests
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, function, *args)
+        try:
+            return HTTPStatus.OK, await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise RequestError(HTTPStatus.GATEWAY_TIMEOUT, "Search timed out")
+        except ValueError as error:
+            raise RequestError(HTTPStatus.BAD_REQUEST, str(error))
+
+    async def read_body(self, reader, headers):
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        try:
+            return await asyncio.wait_for(reader.readexactly(length), self.timeout)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            raise RequestError(HTTPStatus.REQUEST_TIMEOUT, "Timed out reading the request body")
+
+    def parse_query_string(self, query_string):
+        parameters = {name: values[-1] for name, values in parse_qs(query_string).items()}
+        query = parameters.pop("q", None)
+        k = parameters.pop("k", 10)
+        scorer = parameters.pop("scorer", "tfidf")
+        return self.validate(query, parameters, k, scorer)
+
+    def parse_suggest(self, query_string):
+        parameters = {name: values[-1] for name, values in parse_qs(query_string, keep_blank_values=True).items()}
+        text = parameters.get("q")
+        if not isinstance(text, str) or not text.strip():
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Missing query")
+        _, _, k, _ = self.validate(text, {}, parameters.get("k", 10))
+        return text, k
+
+    def parse_body(self, body):
+        try:
+            request = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Body is not valid JSON")
+        if not isinstance(request, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+        return self.validate(request.get("query"), request.get("filters") or {}, request.get("k", 10),
+                             request.get("scorer", "tfidf"))
+
+    def validate(self, query, filters, k, scorer="tfidf"):
+        if not isinstance(query, str) or not query.strip():
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Missing query")
+        if not isinstance(filters, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "filters must be an object")
+        try:
+            k = int(k)
+        except (TypeError, ValueError):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "k must be an integer")
+        if not 0 < k <= self.max_k:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"k must be between 1 and {self.max_k}")
+        if scorer not in SCORERS:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"scorer must be one of: {', '.join(SCORERS)}")
+        return query, filters, k, scorer
+
+
+async def serve(index_folder, restaurants_file, host, port, workers, timeout, cache_size=1024, cache_ttl=300.0):
+    workers = workers or os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                   initargs=(index_folder, restaurants_file, cache_size, cache_ttl))
+    # Load the index in every worker before accepting requests
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[loop.run_in_executor(executor, partial(search_in_worker, "warm up", None, 1))
+                           for _ in range(workers)])
+
+    server = SearchServer(executor, timeout=timeout)
+    async with await server.start(host, port) as http_server:
+        print(f"Serving on http://{host}:{port}")
+        try:
+            await http_server.serve_forever()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON search server")
+    parser.add_argument("--index", default="index", help="folder written by index.py")
+    parser.add_argument("--restaurants", default="restaurants_i.tsv", help="TSV or folder written by dataset.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="scoring processes (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=2.0, help="seconds before a search is abandoned")
+    parser.add_argument("--cache-size", type=int, default=1024, help="cached results per worker (0 disables)")
+    parser.add_argument("--cache-ttl", type=float, default=300.0, help="seconds a cached result stays valid")
+    args = parser.parse_args()
+    asyncio.run(serve(args.index, args.restaurants, args.host, args.port, args.workers, args.timeout,
+                      args.cache_size, args.cache_ttl))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Mean radius of the Earth, in km
+EARTH_RADIUS_KM = 6371.0088
+
+
+# Unit vectors of points on the sphere, so straight-line distances grow with great-circle distances
+def unit_vectors(latitudes, longitudes):
+    latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+    longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+    return np.stack([np.cos(latitudes) * np.cos(longitudes),
+                     np.cos(latitudes) * np.sin(longitudes),
+                     np.sin(latitudes)], axis=-1)
+
+
+# Radius and viewport queries over the coordinates of the restaurants
+class SpatialIndex:
+    """
+    - within_radius: k-d tree over 3D unit vectors, a radius in km becomes a chord length on the unit sphere.
+    - within_bbox: restaurants sorted by latitude, a viewport is a binary search on the latitude
+      followed by a longitude test on that slice.
+    Both return sorted restaurant IDs (positions in the DataFrame), ready to restrict the scoring.
+    Restaurants without coordinates are never returned.
+    """
+
+    def __init__(self, latitudes, longitudes):
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        self.total_documents = len(latitudes)
+        self.doc_ids = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)))
+        self.tree = cKDTree(unit_vectors(latitudes[self.doc_ids], longitudes[self.doc_ids]).reshape(-1, 3))
+
+        order = np.argsort(latitudes[self.doc_ids], kind="stable")
+        self.sorted_ids = self.doc_ids[order]
+        self.sorted_latitudes = latitudes[self.sorted_ids]
+        self.sorted_longitudes = longitudes[self.sorted_ids]
+
+    @classmethod
+    def from_dataframe(cls, restaurants_df):
+        """
+        Uses the latitude and longitude columns added by geocode_restaurants.py.
+        """
+        return cls(restaurants_df["latitude"], restaurants_df["longitude"])
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def within_radius(self, latitude, longitude, radius_km):
+        """
+        Restaurants at most radius_km away (great-circle distance) from the point.
+        """
+        angle = min(max(radius_km, 0.0) / EARTH_RADIUS_KM, np.pi)
+        hits = self.tree.query_ball_point(unit_vectors(latitude, longitude), 2 * np.sin(angle / 2))
+        return np.sort(self.doc_ids[np.asarray(hits, dtype=np.int64)])
+
+    def within_bbox(self, south, west, north, east):
+        """
+        Restaurants inside the viewport; west > east means the box crosses the 180th meridian.
+        """
+        start = np.searchsorted(self.sorted_latitudes, south, side="left")
+        end = np.searchsorted(self.sorted_latitudes, north, side="right")
+        longitudes = self.sorted_longitudes[start:end]
+        if west <= east:
+            inside = (longitudes >= west) & (longitudes <= east)
+        else:
+            inside = (longitudes >= west) | (longitudes <= east)
+        return np.sort(self.sorted_ids[start:end][inside])
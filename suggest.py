@@ -0,0 +1,208 @@
+import re
+import sys
+import time
+import unicodedata
+
+import numpy as np
+
+from analyzer import TOKEN_PATTERN, default_analyzer
+from dataset import read_restaurants
+from index import load_index
+
+# Suggestions returned by default for every kind
+DEFAULT_SUGGESTIONS = 10
+
+
+# Concatenate strings into one UTF-8 buffer and the uint32 offsets of every string
+def pack_strings(strings):
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+# Lowercase a restaurant name and drop its accents, so "Dà Mario" is found by "da m"
+def normalize_name(name):
+    decomposed = unicodedata.normalize("NFKD", str(name).casefold())
+    return re.sub(r"\s+", " ", "".join(char for char in decomposed if not unicodedata.combining(char))).strip()
+
+
+# Sorted keys packed into one UTF-8 buffer, searched by prefix with a binary search
+class PrefixIndex:
+    """
+    Key i is data[offsets[i]:offsets[i + 1]] (UTF-8, sorted), ranked by weights[i] and shown as the
+    packed label i when labels (a (data, offsets) pair) are given, else as the key itself.
+    Byte order of UTF-8 is code point order, so the keys sort like Python strings. A buffer plus uint32
+    offsets takes a few bytes per key, where a NumPy string array pads every key to the longest one.
+    """
+
+    def __init__(self, data, offsets, weights, labels=None):
+        self.data = data
+        self.offsets = offsets
+        self.weights = weights
+        self.labels = labels
+
+    @classmethod
+    def from_items(cls, keys, weights, labels=None):
+        """
+        keys: strings (duplicates are merged, adding their weights); labels: the text shown for each key,
+        the key itself when omitted (the first label of a duplicated key is kept).
+        """
+        merged = {}
+        for position, (key, weight) in enumerate(zip(keys, weights)):
+            if key in merged:
+                merged[key][0] += weight
+            else:
+                merged[key] = [weight, position]
+        sorted_keys = sorted(merged)
+        data, offsets = pack_strings(sorted_keys)
+        weights = np.asarray([merged[key][0] for key in sorted_keys], dtype=np.uint32)
+        if labels is not None:
+            labels = pack_strings([str(labels[merged[key][1]]) for key in sorted_keys])
+        return cls(data, offsets, weights, labels)
+
+    def __len__(self):
+        return len(self.weights)
+
+    def key(self, position):
+        return self.data[self.offsets[position]:self.offsets[position + 1]].tobytes()
+
+    def label(self, position):
+        if self.labels is None:
+            return self.key(position).decode("utf-8")
+        data, offsets = self.labels
+        return data[offsets[position]:offsets[position + 1]].tobytes().decode("utf-8")
+
+    def prefix_range(self, prefix):
+        """
+        Positions [start, end) of the keys starting with the prefix.
+        """
+        prefix = prefix.encode("utf-8")
+        # First key >= prefix
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        start = low
+        # First key whose beginning is past the prefix
+        high = len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle)[:len(prefix)] <= prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return start, low
+
+    def weight(self, key):
+        """
+        Weight of an exact key, or None when it is missing.
+        """
+        start, end = self.prefix_range(key)
+        if start < end and self.key(start) == key.encode("utf-8"):
+            return int(self.weights[start])
+        return None
+
+    def complete(self, prefix, k=DEFAULT_SUGGESTIONS):
+        """
+        The k keys starting with the prefix with the largest weights (ties in key order),
+        as (label, weight) pairs.
+        """
+        start, end = self.prefix_range(prefix)
+        weights = np.asarray(self.weights[start:end], dtype=np.int64)
+        if end - start > k:
+            best = np.argpartition(-weights, k - 1)[:k]
+        else:
+            best = np.arange(end - start)
+        best = best[np.lexsort((best, -weights[best]))]
+        return [(self.label(start + position), int(weights[position])) for position in best]
+
+    def size_in_bytes(self):
+        labels = self.labels[0].nbytes + self.labels[1].nbytes if self.labels is not None else 0
+        return self.data.nbytes + self.offsets.nbytes + self.weights.nbytes + labels
+
+
+# Search-as-you-type over the vocabulary and the restaurant names
+class Suggester:
+    """
+    Completes the last word being typed with vocabulary terms ranked by document frequency, and the
+    whole text with restaurant names ranked by how many restaurants carry them (chains first).
+    """
+
+    def __init__(self, terms, names):
+        self.terms = terms
+        self.names = names
+
+    @classmethod
+    def from_index(cls, index, vocabulary, restaurant_names):
+        """
+        Builds the suggestions from an index and its vocabulary (e.g. returned by load_index), whose
+        postings give the document frequencies, and the restaurantName column.
+        """
+        words = list(vocabulary)
+        document_frequency = np.diff(index.postings.indptr)
+        terms = PrefixIndex.from_items(words, document_frequency[[vocabulary[word] for word in words]])
+        restaurant_names = [name for name in restaurant_names if isinstance(name, str) and name.strip()]
+        names = PrefixIndex.from_items([normalize_name(name) for name in restaurant_names],
+                                       np.ones(len(restaurant_names), dtype=np.uint32), restaurant_names)
+        return cls(terms, names)
+
+    def suggest(self, text, k=DEFAULT_SUGGESTIONS):
+        """
+        Returns {"terms": [{"term", "documents"}], "restaurants": [{"name", "restaurants"}]}.
+        Terms complete the last word of the text, best first. Since the vocabulary holds stems, the
+        stem of the word itself comes after them when it is shorter than the word ("pizzas" -> "pizza"),
+        so a typed prefix never suggests a shorter word above its completions.
+        Nothing is suggested for the last word after a trailing space.
+        """
+        words = TOKEN_PATTERN.findall(text.lower())
+        terms = []
+        if words and not text[-1:].isspace():
+            word = words[-1]
+            best = self.terms.complete(word, k)
+            stem = default_analyzer().stem(word)
+            count = self.terms.weight(stem) if stem != word else None
+            if count is not None and len(best) < k:
+                best.append((stem, count))
+            terms = [{"term": term, "documents": count} for term, count in best]
+        name = normalize_name(text)
+        names = [{"name": label, "restaurants": count} for label, count in self.names.complete(name, k)] if name else []
+        return {"terms": terms, "restaurants": names}
+
+    def size_in_bytes(self):
+        return self.terms.size_in_bytes() + self.names.size_in_bytes()
+
+
+# Time the suggestions of every prefix of a few words
+def measure_latency(suggester, words, k=DEFAULT_SUGGESTIONS):
+    """
+    Returns the mean and worst latency in milliseconds over all the prefixes of the words.
+    """
+    latencies = []
+    for word in words:
+        for end in range(1, len(word) + 1):
+            start = time.perf_counter()
+            suggester.suggest(word[:end], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.mean(latencies)), float(np.max(latencies))
+
+
+def main():
+    index_folder = sys.argv[1] if len(sys.argv) > 1 else "index"
+    restaurants_file = sys.argv[2] if len(sys.argv) > 2 else "restaurants_i.tsv"
+    prefixes = sys.argv[3:] or ["pi", "tratt", "sea"]
+
+    index, vocabulary = load_index(index_folder)
+    restaurants_df, _ = read_restaurants(restaurants_file)
+    suggester = Suggester.from_index(index, vocabulary, restaurants_df["restaurantName"])
+    for prefix in prefixes:
+        print(prefix, suggester.suggest(prefix))
+    mean_ms, worst_ms = measure_latency(suggester, prefixes)
+    print(f"{suggester.size_in_bytes() / 2 ** 20:.1f}MB, {mean_ms:.3f}ms per suggestion on average, {worst_ms:.3f}ms at worst")
+
+
+if __name__ == "__main__":
+    main()